@@ -21,8 +21,9 @@ from src.config import Config
 from src.logger import Logger, route_logger
 from src.project import ProjectManager
 from src.state import AgentState
+from src.token_usage import TokenUsage
 from src.agents import Agent
-from src.llm import LLM
+from src.llm import LLM, InferenceError
 
 
 app = Flask(__name__)
@@ -41,6 +42,7 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 manager = ProjectManager()
 AgentState = AgentState()
+token_usage_counters = TokenUsage()
 config = Config()
 logger = Logger()
 
@@ -61,12 +63,35 @@ def data():
     return jsonify({"projects": project, "models": models, "search_engines": search_engines})
 
 
-@app.route("/api/messages", methods=["POST"])
+@app.route("/api/messages", methods=["GET", "POST"])
 def get_messages():
-    data = request.json
-    project_name = data.get("project_name")
-    messages = manager.get_messages(project_name)
-    return jsonify({"messages": messages})
+    if request.method == "POST":
+        project_name = request.json.get("project_name")
+    else:
+        project_name = request.args.get("project_name")
+    after = request.args.get("after", None, type=int)
+    limit = request.args.get("limit", None, type=int)
+    messages = manager.get_messages(project_name, after, limit)
+    last_id = messages[-1]["id"] if messages else after
+    return jsonify({"messages": messages, "last_id": last_id})
+
+
+def run_agent(execute, message, project_name):
+    try:
+        execute(message, project_name)
+    except InferenceError as e:
+        # Leave the project ready for the next message instead of stuck mid-run
+        logger.error(f"Agent stopped on inference failure: {e}")
+        AgentState.set_agent_active(project_name, False)
+        AgentState.set_agent_completed(project_name, True)
+        manager.add_message_from_devika(
+            project_name,
+            "I couldn't get a response from the model, so I've stopped here. \n"
+            "Send me a message to try again. \n"
+        )
+    finally:
+        # Persist whatever state the agent reached, even if it crashed
+        AgentState.flush(project_name)
 
 
 # Main socket
@@ -82,20 +107,20 @@ def handle_message(data):
 
     state = AgentState.get_latest_state(project_name)
     if not state:
-        thread = Thread(target=lambda: agent.execute(message, project_name))
+        thread = Thread(target=run_agent, args=(agent.execute, message, project_name))
         thread.start()
     else:
         if AgentState.is_agent_completed(project_name):
-            thread = Thread(target=lambda: agent.subsequent_execute(message, project_name))
+            thread = Thread(target=run_agent, args=(agent.subsequent_execute, message, project_name))
             thread.start()
         else:
             emit_agent("info", {"type": "warning", "message": "previous agent doesn't completed it's task."})
             last_state = AgentState.get_latest_state(project_name)
             if last_state["agent_is_active"] or not last_state["completed"]:
-                thread = Thread(target=lambda: agent.execute(message, project_name))
+                thread = Thread(target=run_agent, args=(agent.execute, message, project_name))
                 thread.start()
             else:
-                thread = Thread(target=lambda: agent.subsequent_execute(message, project_name))
+                thread = Thread(target=run_agent, args=(agent.subsequent_execute, message, project_name))
                 thread.start()
 
 @app.route("/api/is-agent-active", methods=["POST"])
@@ -116,6 +141,15 @@ def get_agent_state():
     return jsonify({"state": agent_state})
 
 
+@app.route("/api/agent-state-steps", methods=["GET"])
+@route_logger(logger)
+def get_agent_state_steps():
+    project_name = request.args.get("project_name")
+    after = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", None, type=int)
+    return jsonify(AgentState.get_steps_after(project_name, after, limit))
+
+
 @app.route("/api/get-browser-snapshot", methods=["GET"])
 @route_logger(logger)
 def browser_snapshot():
@@ -170,8 +204,13 @@ def calculate_tokens():
 @route_logger(logger)
 def token_usage():
     project_name = request.args.get("project_name")
-    token_count = AgentState.get_latest_token_usage(project_name)
-    return jsonify({"token_usage": token_count})
+    return jsonify(token_usage_counters.get_usage(project_name))
+
+
+@app.route("/api/llm-metrics", methods=["GET"])
+@route_logger(logger)
+def llm_metrics():
+    return jsonify({"scheduler": LLM.scheduler_metrics(), "prompt_cache": LLM.prompt_cache_metrics()})
 
 
 @app.route("/api/logs", methods=["GET"])
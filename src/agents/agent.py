@@ -16,16 +16,17 @@ from src.state import AgentState
 from src.logger import Logger
 
 from src.bert.sentence import SentenceBert
-from src.memory import KnowledgeBase
+from src.memory import KnowledgeBase, ResearchCache
 from src.browser.search import BingSearch, GoogleSearch, DuckDuckGoSearch
 from src.browser import Browser
 from src.browser import start_interaction
-from src.filesystem import ReadCode
+from src.filesystem import ReadCode, CodeIndex
+from src.llm.context_packer import ContextPacker
+from src.config import Config
 from src.services import Netlify
 from src.documenter.pdf import PDF
 
 import json
-import time
 import platform
 import tiktoken
 import asyncio
@@ -39,6 +40,7 @@ class Agent:
             raise ValueError("base_model is required")
 
         self.logger = Logger()
+        self.base_model = base_model
 
         """
         Accumulate contextual keywords from chained prompts of all preparation agents
@@ -66,6 +68,9 @@ class Agent:
         self.engine = search_engine
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
+        _, model_name = self.action.llm.model_enum(base_model)
+        self.context_packer = ContextPacker(model_name or base_model)
+
     async def open_page(self, project_name, url):
         browser = await Browser().start()
 
@@ -80,6 +85,7 @@ class Agent:
         results = {}
 
         knowledge_base = KnowledgeBase()
+        research_cache = ResearchCache()
 
         if self.engine == "bing":
             web_search = BingSearch()
@@ -90,29 +96,77 @@ class Agent:
 
         self.logger.info(f"\nSearch Engine :: {self.engine}")
 
+        # Queries resolving to the same link share one fetch and one formatting pass
+        links = {}
+        pages = {}
         for query in queries:
-            query = query.strip().lower()
+            query = research_cache.normalize_query(query)
+
+            link = research_cache.get_url(query)
+            if not link:
+                # A similar query may have been researched, it's only reused
+                # while the research cache still holds its link
+                knowledge = knowledge_base.lookup(query)
+                if knowledge and research_cache.get_url(knowledge["tag"]):
+                    self.logger.info(f"using research on '{knowledge['tag']}' for : {query}")
+                    results[query] = knowledge["contents"]
+                    continue
+
+                web_search.search(query)
+                link = web_search.get_first_link()
+                if link:
+                    research_cache.set_url(query, link)
+            print("\nLink :: ", link, '\n')
+            if not link:
+                continue
+
+            summary = research_cache.get_summary(link)
+            if summary:
+                self.logger.info(f"using cached research for : {query}")
+                results[query] = summary
+                continue
 
-            # knowledge = knowledge_base.get_knowledge(tag=query)
-            # if knowledge:
-            #     results[query] = knowledge
-            #     continue
+            links[query] = link
+            if link in pages:
+                continue
 
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
 
-            web_search.search(query)
-
-            link = web_search.get_first_link()
-            print("\nLink :: ", link, '\n')
-            if not link:
-                continue
             browser, raw, data = loop.run_until_complete(self.open_page(project_name, link))
             emit_agent("screenshot", {"data": raw, "project_name": project_name}, False)
-            results[query] = self.formatter.execute(data, project_name)
+            pages[link] = data
+
+        summaries = {}
+        to_format = []
+        for link, data in pages.items():
+            # The page may be unchanged since it was last formatted
+            summary = research_cache.get_summary(link, data)
+            if summary:
+                summaries[link] = summary
+            else:
+                to_format.append(link)
+
+        # Pages are independent, so format them all concurrently
+        formatted = self.formatter.execute_many([pages[link] for link in to_format], project_name)
+        for link, result in zip(to_format, formatted):
+            if isinstance(result, Exception):
+                continue
+            summaries[link] = result
+            research_cache.set_summary(link, pages[link], result)
+
+        researched = []
+        for query, link in links.items():
+            if link not in summaries:
+                continue
+            results[query] = summaries[link]
+            researched.append((query, summaries[link]))
 
             self.logger.info(f"got the search results for : {query}")
-            # knowledge_base.add_knowledge(tag=query, contents=results[query])
+
+        # Knowledge is only ever served alongside the research cache, so there's no use keeping it without one
+        if research_cache.enabled:
+            knowledge_base.add_knowledge_many(researched)
         return results
 
     def update_contextual_keywords(self, sentence: str):
@@ -125,6 +179,42 @@ class Agent:
 
         return self.collected_context_keywords
 
+    def retrieve_code(self, agent: str, project_name: str, messages: list, code_set: list) -> tuple:
+        """
+            Narrow the project code down to what the recent conversation is about,
+            returns `(code_set, ranked)`
+        """
+        config = Config()
+        if not config.get_code_search_enabled():
+            return code_set, False
+
+        query = "\n".join(messages[-3:])
+        hits = CodeIndex().search(project_name, query, config.get_code_search_top_k())
+        if not hits:
+            return code_set, False
+
+        if agent == "answer":
+            return [
+                {"filename": f"{hit['filename']} (lines {hit['start']}-{hit['end']})", "code": hit["code"]}
+                for hit in hits
+            ], True
+
+        # Feature and Patcher rewrite whole files, so they get every file a top chunk came from
+        files = {file["filename"]: file for file in code_set}
+        ranked = dict.fromkeys(hit["filename"] for hit in hits)
+        return [files[filename] for filename in ranked if filename in files], True
+
+    def pack_context(self, agent: str, messages: list, code_set: list, ranked: bool = False) -> tuple:
+        """
+            Fit the conversation and project code into the agent's token budget,
+            keeping the order of a `ranked` code set
+        """
+        budget = Config().get_context_budget(agent)
+        if budget:
+            messages, code_set = self.context_packer.pack(messages, code_set, budget, ranked)
+
+        return messages, ReadCode.files_to_markdown(code_set)
+
     def make_decision(self, prompt: str, project_name: str) -> str:
         decision = self.decision.execute(prompt, project_name)
 
@@ -189,8 +279,13 @@ class Agent:
 
         self.agent_state.set_agent_active(project_name, True)
 
-        conversation = self.project_manager.get_all_messages_formatted(project_name)
-        code_markdown = ReadCode(project_name).code_set_to_markdown()
+        messages = self.project_manager.get_all_messages_formatted(project_name)
+        code_set = ReadCode(project_name).read_directory()
+
+        conversation = messages
+        action_budget = Config().get_context_budget("action")
+        if action_budget:
+            conversation = self.context_packer.pack_messages(messages, action_budget)
 
         response, action = self.action.execute(conversation, project_name)
 
@@ -198,6 +293,13 @@ class Agent:
 
         print("\naction :: ", action, '\n')
 
+        if action in ("answer", "run", "feature", "bug", "report"):
+            agent = {"run": "runner", "bug": "patcher", "report": "reporter"}.get(action, action)
+            ranked = False
+            if agent in ("answer", "feature", "patcher"):
+                code_set, ranked = self.retrieve_code(agent, project_name, messages, code_set)
+            conversation, code_markdown = self.pack_context(agent, messages, code_set, ranked)
+
         if action == "answer":
             response = self.answer.execute(
                 conversation=conversation,
@@ -321,22 +423,25 @@ class Agent:
         ask_user_prompt = "Nothing from the user."
 
         if ask_user != "" and ask_user is not None:
-            self.project_manager.add_message_from_devika(project_name, ask_user)
+            question = self.project_manager.add_message_from_devika(project_name, ask_user)
             self.agent_state.set_agent_active(project_name, False)
-            got_user_query = False
-
-            while not got_user_query:
-                self.logger.info("Waiting for user query...")
+            self.logger.info("Waiting for user query...")
+            latest_message_from_user = self.project_manager.wait_for_user_message(
+                project_name, after=question["id"], timeout=Config().get_timeout_user_reply()
+            )
 
-                latest_message_from_user = self.project_manager.get_latest_message_from_user(project_name)
-                validate_last_message_is_from_user = self.project_manager.validate_last_message_is_from_user(
-                    project_name)
+            if not latest_message_from_user:
+                self.logger.info("No reply from the user, stopping.")
+                self.agent_state.set_agent_completed(project_name, True)
+                self.project_manager.add_message_from_devika(
+                    project_name,
+                    "I didn't hear back from you, so I've stopped here. \n"
+                    "Send me a message whenever you'd like me to continue. \n"
+                )
+                return
 
-                if latest_message_from_user and validate_last_message_is_from_user:
-                    ask_user_prompt = latest_message_from_user["message"]
-                    got_user_query = True
-                    self.project_manager.add_message_from_devika(project_name, "Thanks! 🙌")
-                time.sleep(5)
+            ask_user_prompt = latest_message_from_user["message"]
+            self.project_manager.add_message_from_devika(project_name, "Thanks! 🙌")
 
         self.agent_state.set_agent_active(project_name, True)
 
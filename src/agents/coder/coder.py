@@ -6,6 +6,7 @@ from typing import List, Dict, Union
 
 from src.config import Config
 from src.llm import LLM
+from src.filesystem import ReadCode
 from src.state import AgentState
 from src.logger import Logger
 from src.services.utils import retry_wrapper
@@ -18,7 +19,7 @@ class Coder:
         config = Config()
         self.project_dir = config.get_projects_dir()
         self.logger = Logger()
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="coder")
 
     def render(
         self, step_by_step_plan: str, user_context: str, search_results: dict
@@ -77,6 +78,7 @@ class Coder:
             with open(file_path, "w", encoding="utf-8") as f:
                 f.write(file["code"])
         
+        ReadCode.invalidate(project_name, [file['file'] for file in response])
         return file_path_dir
 
     def get_project_path(self, project_name: str):
@@ -120,7 +122,7 @@ class Coder:
         project_name: str
     ) -> str:
         prompt = self.render(step_by_step_plan, user_context, search_results)
-        response = self.llm.inference(prompt, project_name)
+        response = self.llm.inference(prompt, project_name, stream=True)
         
         valid_response = self.validate_response(response)
         
@@ -9,7 +9,7 @@ PROMPT = open("src/agents/decision/prompt.jinja2").read().strip()
 
 class Decision:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="decision")
 
     def render(self, prompt: str) -> str:
         env = Environment(loader=BaseLoader())
@@ -6,6 +6,7 @@ from typing import List, Dict, Union
 
 from src.config import Config
 from src.llm import LLM
+from src.filesystem import ReadCode
 from src.state import AgentState
 from src.services.utils import retry_wrapper
 from src.socket_instance import emit_agent
@@ -18,7 +19,7 @@ class Feature:
         config = Config()
         self.project_dir = config.get_projects_dir()
         
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="feature")
 
     def render(
         self,
@@ -75,6 +76,7 @@ class Feature:
             with open(file_path, "w", encoding="utf-8") as f:
                 f.write(file["code"])
         
+        ReadCode.invalidate(project_name, [file['file'] for file in response])
         return file_path_dir
 
     def get_project_path(self, project_name: str):
@@ -116,7 +118,7 @@ class Feature:
         project_name: str
     ) -> str:
         prompt = self.render(conversation, code_markdown, system_os)
-        response = self.llm.inference(prompt, project_name)
+        response = self.llm.inference(prompt, project_name, stream=True)
         
         valid_response = self.validate_response(response)
         
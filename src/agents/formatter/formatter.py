@@ -6,7 +6,7 @@ PROMPT = open("src/agents/formatter/prompt.jinja2").read().strip()
 
 class Formatter:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="formatter")
 
     def render(self, raw_text: str) -> str:
         env = Environment(loader=BaseLoader())
@@ -19,4 +19,8 @@ class Formatter:
     def execute(self, raw_text: str, project_name: str) -> str:
         raw_text = self.render(raw_text)
         response = self.llm.inference(raw_text, project_name)
-        return response
\ No newline at end of file
+        return response
+
+    def execute_many(self, raw_texts: list, project_name: str) -> list:
+        prompts = [self.render(raw_text) for raw_text in raw_texts]
+        return self.llm.inference_many(prompts, project_name)
\ No newline at end of file
@@ -9,7 +9,7 @@ PROMPT = open("src/agents/internal_monologue/prompt.jinja2").read().strip()
 
 class InternalMonologue:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="internal_monologue")
 
     def render(self, current_prompt: str) -> str:
         env = Environment(loader=BaseLoader())
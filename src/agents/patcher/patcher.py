@@ -7,6 +7,7 @@ from src.socket_instance import emit_agent
 
 from src.config import Config
 from src.llm import LLM
+from src.filesystem import ReadCode
 from src.state import AgentState
 from src.services.utils import retry_wrapper
 
@@ -17,7 +18,7 @@ class Patcher:
         config = Config()
         self.project_dir = config.get_projects_dir()
         
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="patcher")
 
     def render(
         self,
@@ -78,6 +79,7 @@ class Patcher:
             with open(file_path, "w", encoding="utf-8") as f:
                 f.write(file["code"])
     
+        ReadCode.invalidate(project_name, [file['file'] for file in response])
         return file_path_dir
     def get_project_path(self, project_name: str):
         project_name = project_name.lower().replace(" ", "-")
@@ -126,7 +128,7 @@ class Patcher:
             error,
             system_os
         )
-        response = self.llm.inference(prompt, project_name)
+        response = self.llm.inference(prompt, project_name, stream=True)
         
         valid_response = self.validate_response(response)
         
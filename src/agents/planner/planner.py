@@ -6,7 +6,7 @@ PROMPT = open("src/agents/planner/prompt.jinja2").read().strip()
 
 class Planner:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="planner")
 
     def render(self, prompt: str) -> str:
         env = Environment(loader=BaseLoader())
@@ -9,7 +9,7 @@ PROMPT = open("src/agents/reporter/prompt.jinja2").read().strip()
 
 class Reporter:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="reporter")
 
     def render(self, conversation: list, code_markdown: str) -> str:
         env = Environment(loader=BaseLoader())
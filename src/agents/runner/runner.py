@@ -18,7 +18,7 @@ RERUNNER_PROMPT = open("src/agents/runner/rerunner.jinja2", "r").read().strip()
 class Runner:
     def __init__(self, base_model: str):
         self.base_model = base_model
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent="runner")
 
     def render(
         self,
@@ -1,9 +1,10 @@
-from flask import blueprints, request, jsonify, send_file, make_response
+from flask import blueprints, request, jsonify, send_file, make_response, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from src.logger import Logger, route_logger
 from src.config import Config
 from src.project import ProjectManager
 from ..state import AgentState
+from ..token_usage import TokenUsage
 
 import os
 
@@ -22,6 +23,24 @@ def project_files():
     files = manager.get_project_files(project_name)  
     return jsonify({"files": files})
 
+@project_bp.route("/api/get-project-tree", methods=["GET"])
+@route_logger(logger)
+def project_tree():
+    project_name = secure_filename(request.args.get("project_name"))
+    files = manager.get_project_tree(project_name)
+    return jsonify({"files": files})
+
+
+@project_bp.route("/api/get-project-file", methods=["GET"])
+@route_logger(logger)
+def project_file():
+    project_name = secure_filename(request.args.get("project_name"))
+    path = request.args.get("path")
+    code = manager.get_project_file(project_name, path)
+    if code is None:
+        return jsonify({"error": "File not found or not readable"}), 404
+    return jsonify({"file": path, "code": code})
+
 @project_bp.route("/api/create-project", methods=["POST"])
 @route_logger(logger)
 def create_project():
@@ -38,6 +57,7 @@ def delete_project():
     project_name = secure_filename(data.get("project_name"))
     manager.delete_project(project_name)
     AgentState().delete_state(project_name)
+    TokenUsage().delete_usage(project_name)
     return jsonify({"message": "Project deleted"})
 
 
@@ -45,9 +65,11 @@ def delete_project():
 @route_logger(logger)
 def download_project():
     project_name = secure_filename(request.args.get("project_name"))
-    manager.project_to_zip(project_name)
-    project_path = manager.get_zip_path(project_name)
-    return send_file(project_path, as_attachment=False)
+    return Response(
+        stream_with_context(manager.project_zip_stream(project_name)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={project_name}.zip"}
+    )
 
 
 @project_bp.route("/api/download-project-pdf", methods=["GET"])
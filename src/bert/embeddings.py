@@ -0,0 +1,46 @@
+import threading
+
+import numpy as np
+
+"""
+One sentence-transformer per process for everything that embeds text.
+
+The model is the one KeyBERT loads by default, so keyword extraction and
+retrieval share a single copy in memory. It's loaded on first use.
+"""
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+BATCH_SIZE = 64
+
+
+class Embedder:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._model = None
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    @property
+    def model(self):
+        with self.lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(MODEL_NAME)
+            return self._model
+
+    def encode(self, texts: list) -> np.ndarray:
+        """
+        Unit-length float32 embeddings, one row per text.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.model.encode(
+            texts,
+            batch_size=BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32)
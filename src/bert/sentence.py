@@ -1,17 +1,74 @@
-from keybert import KeyBERT
+import hashlib
+import threading
+from collections import OrderedDict
+
+from src.bert.embeddings import Embedder
+
+"""
+Keyword extraction with KeyBERT.
+
+A single KeyBERT per process wraps the shared `Embedder` model, so it's loaded
+once and not again for every `SentenceBert`. `extract_keywords_many` embeds
+a batch of sentences in one pass. Results are cached by sentence hash.
+"""
+
+MAX_CACHED = 1024
+
 
 class SentenceBert:
-    def __init__(self, sentence: str):
+    kw_model = None
+    keywords = OrderedDict()
+    lock = threading.Lock()
+
+    def __init__(self, sentence: str = None):
         self.sentence = sentence
-        self.kw_model = KeyBERT()
+
+    @classmethod
+    def model(cls):
+        with cls.lock:
+            if cls.kw_model is None:
+                from keybert import KeyBERT
+                cls.kw_model = KeyBERT(model=Embedder().model)
+            return cls.kw_model
+
+    @staticmethod
+    def cache_key(sentence: str, top_n: int) -> str:
+        return f"{top_n}:{hashlib.sha256(sentence.encode('utf-8')).hexdigest()}"
 
     def extract_keywords(self, top_n: int = 5) -> list:
-        keywords = self.kw_model.extract_keywords(
-            self.sentence,
-            keyphrase_ngram_range=(1, 1),
-            stop_words='english',
-            top_n=top_n,
-            use_mmr=True,
-            diversity=0.7
-        )
-        return keywords
+        return self.extract_keywords_many([self.sentence], top_n)[0]
+
+    def extract_keywords_many(self, sentences: list, top_n: int = 5) -> list:
+        """
+        `(keyword, score)` lists, one per sentence, extracting only the ones not cached yet.
+        """
+        found = {}
+        with self.lock:
+            for sentence in sentences:
+                key = self.cache_key(sentence, top_n)
+                if key in self.keywords:
+                    self.keywords.move_to_end(key)
+                    found[sentence] = self.keywords[key]
+        missing = [sentence for sentence in dict.fromkeys(sentences) if sentence not in found]
+
+        if missing:
+            extracted = self.model().extract_keywords(
+                missing,
+                keyphrase_ngram_range=(1, 1),
+                stop_words='english',
+                top_n=top_n,
+                use_mmr=True,
+                diversity=0.7
+            )
+            # KeyBERT returns a flat list for a single document
+            if len(missing) == 1:
+                extracted = [extracted]
+
+            with self.lock:
+                for sentence, keywords in zip(missing, extracted):
+                    found[sentence] = keywords
+                    self.keywords[self.cache_key(sentence, top_n)] = keywords
+                while len(self.keywords) > MAX_CACHED:
+                    self.keywords.popitem(last=False)
+
+        return [found[sentence] for sentence in sentences]
@@ -108,6 +108,100 @@ class Config:
     def get_timeout_inference(self):
         return self.config["TIMEOUT"]["INFERENCE"]
 
+    def get_timeout_user_reply(self):
+        return self.config["TIMEOUT"]["USER_REPLY"]
+
+    def get_provider_concurrency(self, provider):
+        return self.config["CONCURRENCY"].get(provider, 4)
+
+    def get_rate_limits(self, provider, model):
+        limits = self.config["RATE_LIMITS"]
+        return limits.get(model, limits.get(provider, {}))
+
+    def get_hedging_fallback(self, agent):
+        hedging = self.config["HEDGING"]
+        if hedging["ENABLED"] != "true":
+            return None
+        return hedging.get("AGENTS", {}).get(agent)
+
+    def get_hedging_percentile(self):
+        return self.config["HEDGING"]["PERCENTILE"]
+
+    def get_hedging_min_samples(self):
+        return self.config["HEDGING"]["MIN_SAMPLES"]
+
+    def get_hedging_default_delay(self):
+        return self.config["HEDGING"]["DEFAULT_DELAY"]
+
+    def get_context_budget(self, agent):
+        return self.config["CONTEXT"]["BUDGETS"].get(agent)
+
+    def get_context_conversation_share(self):
+        return self.config["CONTEXT"]["CONVERSATION_SHARE"]
+
+    def get_rag_enabled(self):
+        return self.config["RAG"]["ENABLED"] == "true"
+
+    def get_rag_min_score(self):
+        return self.config["RAG"]["MIN_SCORE"]
+
+    def get_rag_path(self):
+        return self.config["RAG"]["PATH"]
+
+    def get_rag_dtype(self):
+        return self.config["RAG"]["DTYPE"]
+
+    def get_knowledge_min_relevance(self):
+        return self.config["KNOWLEDGE"]["MIN_RELEVANCE"]
+
+    def get_research_cache_enabled(self):
+        return self.config["RESEARCH_CACHE"]["ENABLED"] == "true"
+
+    def get_research_cache_query_ttl(self):
+        return self.config["RESEARCH_CACHE"]["QUERY_TTL"]
+
+    def get_research_cache_page_ttl(self):
+        return self.config["RESEARCH_CACHE"]["PAGE_TTL"]
+
+    def get_research_cache_max_entries(self):
+        return self.config["RESEARCH_CACHE"]["MAX_ENTRIES"]
+
+    def get_code_search_enabled(self):
+        return self.config["CODE_SEARCH"]["ENABLED"] == "true"
+
+    def get_code_search_top_k(self):
+        return self.config["CODE_SEARCH"]["TOP_K"]
+
+    def get_code_search_embeddings(self):
+        return self.config["CODE_SEARCH"]["EMBEDDINGS"] == "true"
+
+    def get_code_search_embedding_weight(self):
+        return self.config["CODE_SEARCH"]["EMBEDDING_WEIGHT"]
+
+    def get_project_max_file_size(self):
+        return self.config["PROJECT_FILES"]["MAX_FILE_SIZE"]
+
+    def get_project_max_files(self):
+        return self.config["PROJECT_FILES"]["MAX_FILES"]
+
+    def get_state_flush_interval(self):
+        return self.config["STATE_CACHE"]["FLUSH_INTERVAL"]
+
+    def get_llm_cache_enabled(self):
+        return self.config["LLM_CACHE"]["ENABLED"] == "true"
+
+    def get_llm_cache_path(self):
+        return self.config["LLM_CACHE"]["PATH"]
+
+    def get_llm_cache_max_entries(self):
+        return self.config["LLM_CACHE"]["MAX_ENTRIES"]
+
+    def get_llm_cache_ttl(self):
+        return self.config["LLM_CACHE"]["TTL"]
+
+    def get_llm_cache_agent_ttl(self):
+        return self.config["LLM_CACHE"].get("AGENT_TTL", {})
+
     def set_bing_api_key(self, key):
         self.config["API_KEYS"]["BING"] = key
         self.save_config()
@@ -0,0 +1,59 @@
+import threading
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, create_engine
+
+from src.config import Config
+
+"""
+One SQLite engine per process, shared by every storage class.
+
+Connections use WAL journaling so readers don't block the writer,
+`synchronous=NORMAL` (safe under WAL) and a busy timeout so concurrent
+agent threads wait for the write lock instead of failing.
+"""
+
+BUSY_TIMEOUT_MS = 5000
+
+_engine = None
+_created_tables = set()
+_lock = threading.Lock()
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def get_engine():
+    """
+    Returns the shared engine, creating any tables and indexes of models
+    imported since the last call.
+    """
+    global _engine
+
+    with _lock:
+        if _engine is None:
+            sqlite_path = Config().get_sqlite_db()
+            _engine = create_engine(
+                f"sqlite:///{sqlite_path}",
+                connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000},
+                pool_size=10,
+                max_overflow=20,
+                pool_pre_ping=True,
+            )
+            event.listen(_engine, "connect", _set_sqlite_pragmas)
+
+        tables = set(SQLModel.metadata.tables)
+        if tables - _created_tables:
+            SQLModel.metadata.create_all(_engine)
+            # create_all skips indexes on tables that already exist
+            for table in SQLModel.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(_engine, checkfirst=True)
+            _created_tables.update(tables)
+
+    return _engine
@@ -1 +1,3 @@
-from .read_code import ReadCode
\ No newline at end of file
+from .read_code import ReadCode
+from .file_index import FileIndex
+from .code_index import CodeIndex
@@ -0,0 +1,213 @@
+import os
+import re
+import math
+import hashlib
+import threading
+from collections import Counter
+
+from src.config import Config
+from .read_code import ReadCode
+
+"""
+Retrieval over project code for agent prompts.
+
+Files are split into chunks at function/class definitions and ranked
+against a query with BM25. With `[CODE_SEARCH] EMBEDDINGS` on, the BM25
+score is blended with the cosine similarity of sentence-transformer
+embeddings. Chunks are cached per file hash, so only files that changed
+since the last search are re-chunked or re-embedded.
+"""
+
+DEFINITION_PATTERN = re.compile(
+    r"^\s*(async def |def |class |function |export |func |fn |pub fn |impl |struct |interface |"
+    r"public |private |protected |module |type |(const|let|var) \w+ = (async )?(\(|function))"
+)
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+CAMEL_PATTERN = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+STOP_WORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "are", "was", "you", "your",
+    "can", "please", "into", "have", "has", "not", "but", "all", "any", "use", "make",
+    "devika", "user", "self", "return", "import", "def", "class", "function", "const",
+}
+
+MAX_INDENT = 4
+MIN_CHUNK_LINES = 5
+MAX_CHUNK_LINES = 80
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased identifiers plus their snake_case and camelCase parts.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        parts = {identifier.lower()}
+        for piece in identifier.split("_"):
+            parts.update(part.lower() for part in CAMEL_PATTERN.findall(piece))
+        tokens.extend(part for part in parts if len(part) > 1 and part not in STOP_WORDS)
+    return tokens
+
+
+def chunk_code(code: str) -> list:
+    """
+    Split `code` into `(start_line, end_line, text)` chunks at top-level and
+    method definitions, keeping decorators with what they decorate.
+    """
+    lines = code.splitlines()
+    if not lines:
+        return []
+
+    boundaries = [0]
+    for index, line in enumerate(lines):
+        indent = len(line) - len(line.lstrip())
+        if index and indent <= MAX_INDENT and DEFINITION_PATTERN.match(line):
+            start = index
+            while start > boundaries[-1] + 1 and lines[start - 1].strip().startswith("@"):
+                start -= 1
+            if start - boundaries[-1] >= MIN_CHUNK_LINES:
+                boundaries.append(start)
+    boundaries.append(len(lines))
+
+    chunks = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        for window in range(start, end, MAX_CHUNK_LINES):
+            window_end = min(window + MAX_CHUNK_LINES, end)
+            text = "\n".join(lines[window:window_end])
+            if text.strip():
+                chunks.append((window + 1, window_end, text))
+    return chunks
+
+
+class CodeIndex:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.file_chunks = {}
+            cls._instance.embeddings = {}
+            cls._instance.projects = {}
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def chunks_for(self, filename: str, file_hash: str, code: str) -> list:
+        key = (filename, file_hash)
+        if key not in self.file_chunks:
+            self.file_chunks[key] = [
+                {
+                    "filename": filename,
+                    "start": start,
+                    "end": end,
+                    "code": text,
+                    "terms": Counter(tokenize(f"{filename}\n{text}")),
+                    "hash": hashlib.sha256(text.encode("utf-8")).hexdigest()
+                }
+                for start, end, text in chunk_code(code)
+            ]
+        return self.file_chunks[key]
+
+    def build(self, project_name: str) -> dict:
+        sections = ReadCode(project_name).read_sections()
+        signature = tuple((section["filename"], section["hash"]) for section in sections)
+
+        with self.lock:
+            index = self.projects.get(project_name)
+            if index and index["signature"] == signature:
+                return index
+
+            # Forget chunks of this project's files that changed or went away
+            live = set(signature)
+            prefix = os.path.join(ReadCode(project_name).directory_path, "")
+            for key in [key for key in self.file_chunks if key[0].startswith(prefix) and key not in live]:
+                self.file_chunks.pop(key)
+
+            chunks = []
+            for section in sections:
+                chunks.extend(self.chunks_for(section["filename"], section["hash"], section["code"]))
+
+            document_frequency = Counter()
+            for chunk in chunks:
+                document_frequency.update(chunk["terms"].keys())
+
+            lengths = [sum(chunk["terms"].values()) for chunk in chunks]
+            index = {
+                "signature": signature,
+                "chunks": chunks,
+                "lengths": lengths,
+                "average_length": (sum(lengths) / len(lengths)) if lengths else 0,
+                "document_frequency": document_frequency,
+            }
+            self.projects[project_name] = index
+
+            live_hashes = {chunk["hash"] for chunks in self.file_chunks.values() for chunk in chunks}
+            for chunk_hash in [chunk_hash for chunk_hash in self.embeddings if chunk_hash not in live_hashes]:
+                self.embeddings.pop(chunk_hash)
+            return index
+
+    @staticmethod
+    def bm25(index: dict, query_terms: list) -> list:
+        count = len(index["chunks"])
+        average_length = index["average_length"] or 1
+        scores = []
+        for chunk, length in zip(index["chunks"], index["lengths"]):
+            score = 0.0
+            for term in query_terms:
+                frequency = chunk["terms"].get(term)
+                if not frequency:
+                    continue
+                df = index["document_frequency"][term]
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                )
+            scores.append(score)
+        return scores
+
+    def similarities(self, index: dict, query: str) -> list:
+        from src.bert.embeddings import Embedder
+
+        embedder = Embedder()
+        # `build` prunes the embeddings under the lock, so only touch them while holding it
+        with self.lock:
+            vectors = {chunk["hash"]: self.embeddings.get(chunk["hash"]) for chunk in index["chunks"]}
+
+        missing = [chunk for chunk in index["chunks"] if vectors[chunk["hash"]] is None]
+        if missing:
+            encoded = embedder.encode([chunk["code"] for chunk in missing])
+            with self.lock:
+                for chunk, vector in zip(missing, encoded):
+                    vectors[chunk["hash"]] = vector
+                    self.embeddings[chunk["hash"]] = vector
+
+        query_vector = embedder.encode([query])[0]
+        return [float(vectors[chunk["hash"]] @ query_vector) for chunk in index["chunks"]]
+
+    def search(self, project_name: str, query: str, k: int) -> list:
+        """
+        Top `k` chunks for `query` as dicts with filename, start, end, code and score.
+        """
+        index = self.build(project_name)
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not index["chunks"] or not query_terms:
+            return []
+
+        scores = self.bm25(index, query_terms)
+        top_score = max(scores)
+        if top_score > 0:
+            scores = [score / top_score for score in scores]
+
+        config = Config()
+        if config.get_code_search_embeddings():
+            weight = config.get_code_search_embedding_weight()
+            similarities = self.similarities(index, query)
+            scores = [score + weight * similarity for score, similarity in zip(scores, similarities)]
+
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [
+            {key: index["chunks"][i][key] for key in ("filename", "start", "end", "code")} | {"score": scores[i]}
+            for i in ranked[:k]
+            if scores[i] > 0
+        ]
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import threading
+
+from src.config import Config
+from .ignore import walk_project
+
+"""
+Per-project index of file metadata: path, size, mtime, content hash and
+whether the file is binary.
+
+`refresh` only stats the tree and re-reads files whose size or mtime changed,
+so listing a project stays cheap however often it's called. Files over the
+configured size limit are listed but never read, and walking stops after the
+configured number of files.
+"""
+
+SNIFF_SIZE = 8192
+
+
+class FileIndex:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.projects = {}
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    @staticmethod
+    def describe(path: str, relative_path: str, stat: os.stat_result, max_file_size: int) -> dict:
+        entry = {
+            "path": relative_path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": None,
+            "binary": False,
+            "too_large": stat.st_size > max_file_size,
+        }
+
+        with open(path, "rb") as f:
+            if entry["too_large"]:
+                entry["binary"] = b"\0" in f.read(SNIFF_SIZE)
+                return entry
+            data = f.read()
+
+        entry["hash"] = hashlib.sha256(data).hexdigest()
+        if b"\0" in data[:SNIFF_SIZE]:
+            entry["binary"] = True
+        else:
+            try:
+                data.decode("utf-8")
+            except UnicodeDecodeError:
+                entry["binary"] = True
+        return entry
+
+    def refresh(self, directory: str) -> list:
+        """
+        Bring the index for `directory` up to date and return its entries by path.
+        """
+        directory = os.path.abspath(directory)
+        config = Config()
+        max_file_size = config.get_project_max_file_size()
+        max_files = config.get_project_max_files()
+
+        with self.lock:
+            previous = self.projects.get(directory, {})
+
+        entries = {}
+        if os.path.isdir(directory):
+            for path, relative_path in walk_project(directory):
+                if len(entries) >= max_files:
+                    break
+                try:
+                    stat = os.stat(path)
+                    entry = previous.get(relative_path)
+                    if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                        entry = self.describe(path, relative_path, stat, max_file_size)
+                except OSError:
+                    continue
+                entries[relative_path] = entry
+
+        with self.lock:
+            self.projects[directory] = entries
+        return [entries[path] for path in sorted(entries)]
+
+    def text_files(self, directory: str) -> list:
+        """
+        Entries whose content can be read as text within the size limit.
+        """
+        return [entry for entry in self.refresh(directory) if not entry["binary"] and not entry["too_large"]]
+
+    def read(self, directory: str, relative_path: str):
+        """
+        Text content of one indexed file, None if it's unknown, binary or too large.
+        """
+        directory = os.path.abspath(directory)
+        entry = self.projects.get(directory, {}).get(relative_path)
+        if entry is None:
+            self.refresh(directory)
+            entry = self.projects.get(directory, {}).get(relative_path)
+        if entry is None or entry["binary"] or entry["too_large"]:
+            return None
+
+        try:
+            with open(os.path.join(directory, relative_path), "r", encoding="utf-8") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def forget(self, directory: str, paths: list = None):
+        """
+        Drop index entries so the next refresh re-reads them, all of them if `paths` is None.
+        """
+        directory = os.path.abspath(directory)
+        with self.lock:
+            if paths is None:
+                self.projects.pop(directory, None)
+            elif directory in self.projects:
+                entries = dict(self.projects[directory])
+                for path in paths:
+                    entries.pop(path, None)
+                self.projects[directory] = entries
@@ -0,0 +1,29 @@
+import os
+
+"""
+Directories that never belong in exports or listings of a generated project:
+installed dependencies, virtualenvs, VCS metadata and build caches.
+"""
+
+IGNORED_DIRS = {
+    "node_modules",
+    ".venv",
+    "venv",
+    "__pycache__",
+    ".git",
+    ".next",
+    ".mypy_cache",
+    ".pytest_cache",
+}
+
+
+def walk_project(directory: str):
+    """
+    Yield `(path, relative_path)` for every file under `directory`, in a stable
+    order, without descending into ignored directories.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            yield path, os.path.relpath(path, directory)
@@ -1,35 +1,94 @@
 import os
+import threading
 
 from src.config import Config
+from .file_index import FileIndex
 
 """
 TODO: Replace this with `code2prompt` - https://github.com/mufeedvh/code2prompt
 """
 
 class ReadCode:
+    # Per project directory: contents and rendered markdown of each file,
+    # reused while the file's hash in the FileIndex is unchanged
+    sections = {}
+    lock = threading.Lock()
+
     def __init__(self, project_name: str):
         config = Config()
         project_path = config.get_projects_dir()
         self.directory_path = os.path.join(project_path, project_name.lower().replace(" ", "-"))
+        self.directory_key = os.path.abspath(self.directory_path)
+
+    def read_sections(self) -> list:
+        file_index = FileIndex()
+        with ReadCode.lock:
+            cached = ReadCode.sections.get(self.directory_key, {})
+
+        sections = {}
+        for entry in file_index.text_files(self.directory_path):
+            section = cached.get(entry["path"])
+            if section is None or section["hash"] != entry["hash"]:
+                code = file_index.read(self.directory_path, entry["path"])
+                if code is None:
+                    continue
+                filename = os.path.join(self.directory_path, entry["path"])
+                section = {
+                    "hash": entry["hash"],
+                    "filename": filename,
+                    "code": code,
+                    "markdown": self.file_to_markdown(filename, code)
+                }
+            sections[entry["path"]] = section
+
+        with ReadCode.lock:
+            ReadCode.sections[self.directory_key] = sections
+        return list(sections.values())
 
     def read_directory(self):
-        files_list = []
-        for root, _dirs, files in os.walk(self.directory_path):
-            for file in files:
-                try:
-                    file_path = os.path.join(root, file)
-                    with open(file_path, 'r') as file_content:
-                        files_list.append({"filename": file_path, "code": file_content.read()})
-                except:
-                    pass
-
-        return files_list
+        """
+        Files as dicts with filename and code, plus their cached `markdown`
+        for `files_to_markdown` to reuse.
+        """
+        return [
+            {"filename": section["filename"], "code": section["code"], "markdown": section["markdown"]}
+            for section in self.read_sections()
+        ]
 
     def code_set_to_markdown(self):
-        code_set = self.read_directory()
-        markdown = ""
-        for code in code_set:
-            markdown += f"### {code['filename']}:\n\n"
-            markdown += f"```\n{code['code']}\n```\n\n"
-            markdown += "---\n\n"
-        return markdown
+        return self.files_to_markdown(self.read_directory())
+
+    @classmethod
+    def invalidate(cls, project_name: str, paths: list = None):
+        """
+        Drop cached contents for `paths` (relative to the project, all files if
+        None) after an agent writes them, without waiting for an mtime change.
+        """
+        directory_key = cls(project_name).directory_key
+        if paths is not None:
+            paths = [os.path.normpath(path) for path in paths]
+
+        FileIndex().forget(directory_key, paths)
+        with cls.lock:
+            if paths is None:
+                cls.sections.pop(directory_key, None)
+            else:
+                sections = dict(cls.sections.get(directory_key, {}))
+                for path in paths:
+                    sections.pop(path, None)
+                cls.sections[directory_key] = sections
+
+    @staticmethod
+    def file_to_markdown(filename: str, code: str) -> str:
+        return f"### {filename}:\n\n```\n{code}\n```\n\n---\n\n"
+
+    @staticmethod
+    def files_to_markdown(code_set: list) -> str:
+        """
+        Markdown for `code_set`, reusing each file's cached rendering unless it
+        was trimmed or replaced by a snippet since `read_directory`.
+        """
+        return "".join(
+            code.get("markdown") or ReadCode.file_to_markdown(code["filename"], code["code"])
+            for code in code_set
+        )
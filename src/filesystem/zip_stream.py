@@ -0,0 +1,162 @@
+import os
+import time
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+
+from .ignore import walk_project
+
+"""
+Streams a project as a ZIP archive straight into the HTTP response.
+
+Each file is deflated on its own, and the compressed bytes are kept in a
+bounded LRU keyed by (path, mtime, size), so re-downloading a project only
+compresses the files that changed. Files too large to cache are compressed
+chunk by chunk with a trailing data descriptor, so nothing is ever buffered
+whole. Archives are plain ZIP (no ZIP64), i.e. limited to 4 GiB.
+"""
+
+CHUNK_SIZE = 1024 * 1024
+MAX_CACHED_FILE = 8 * 1024 * 1024
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+
+DEFLATED = 8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+VERSION = 20
+# High byte 3 marks the external attributes as Unix permissions
+MADE_BY_UNIX = (3 << 8) | VERSION
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+DATA_DESCRIPTOR = struct.Struct("<4s3L")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+
+
+def dos_datetime(mtime: float) -> tuple:
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        return 0, (1 << 5) | 1
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ZipStream:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.entries = OrderedDict()
+            cls._instance.cached_bytes = 0
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def compressed(self, path: str, stat: os.stat_result) -> tuple:
+        """
+        `(crc, compressed_bytes, size)` for a small file, from the cache when unchanged.
+        `size` is what was actually read, the file may have changed since `stat`.
+        """
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        entry = (zlib.crc32(data), compressor.compress(data) + compressor.flush(), len(data))
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = entry
+                self.cached_bytes += len(entry[1])
+            while self.cached_bytes > MAX_CACHE_BYTES:
+                _, (_, evicted, _) = self.entries.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+        return entry
+
+    @staticmethod
+    def compress_chunks(path: str):
+        """
+        Yield deflated chunks of a large file, then `(crc, compressed_size, size)` last.
+        """
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc = 0
+        compressed_size = 0
+        size = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                data = compressor.compress(chunk)
+                if data:
+                    compressed_size += len(data)
+                    yield data
+        data = compressor.flush()
+        compressed_size += len(data)
+        yield data
+        yield crc, compressed_size, size
+
+    def stream(self, directory: str, arc_root: str = ""):
+        """
+        Yield the bytes of a ZIP archive of `directory`, entries named under `arc_root`.
+        """
+        offset = 0
+        central_directory = []
+
+        for path, relative_path in walk_project(directory):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            name = os.path.join(arc_root, relative_path).replace(os.sep, "/").encode("utf-8")
+            mod_time, mod_date = dos_datetime(stat.st_mtime)
+            header_offset = offset
+
+            if stat.st_size <= MAX_CACHED_FILE:
+                try:
+                    crc, data, size = self.compressed(path, stat)
+                except OSError:
+                    continue
+                flags = FLAG_UTF8
+                header = LOCAL_HEADER.pack(
+                    b"PK\x03\x04", VERSION, flags, DEFLATED, mod_time, mod_date,
+                    crc, len(data), size, len(name), 0
+                )
+                yield header + name
+                yield data
+                compressed_size = len(data)
+                offset += len(header) + len(name) + compressed_size
+            else:
+                flags = FLAG_UTF8 | FLAG_DATA_DESCRIPTOR
+                header = LOCAL_HEADER.pack(
+                    b"PK\x03\x04", VERSION, flags, DEFLATED, mod_time, mod_date,
+                    0, 0, 0, len(name), 0
+                )
+                yield header + name
+                offset += len(header) + len(name)
+                for chunk in self.compress_chunks(path):
+                    if isinstance(chunk, tuple):
+                        crc, compressed_size, size = chunk
+                    else:
+                        yield chunk
+                offset += compressed_size
+                descriptor = DATA_DESCRIPTOR.pack(b"PK\x07\x08", crc, compressed_size, size)
+                yield descriptor
+                offset += len(descriptor)
+
+            central_directory.append(CENTRAL_HEADER.pack(
+                b"PK\x01\x02", MADE_BY_UNIX, VERSION, flags, DEFLATED, mod_time, mod_date,
+                crc, compressed_size, size, len(name), 0, 0, 0, 0,
+                (stat.st_mode & 0xFFFF) << 16, header_offset
+            ) + name)
+
+        directory_bytes = b"".join(central_directory)
+        yield directory_bytes
+        yield END_RECORD.pack(
+            b"PK\x05\x06", 0, 0, len(central_directory), len(central_directory),
+            len(directory_bytes), offset, 0
+        )
@@ -1 +1 @@
-from .llm import LLM
\ No newline at end of file
+from .llm import LLM, InferenceError, InferenceTimeoutError
\ No newline at end of file
@@ -0,0 +1,163 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+from src.config import Config
+
+"""
+On-disk prompt/response cache for `LLM.inference`.
+
+Entries are keyed by model id + sha256 of the rendered prompt. Eviction is LRU
+(by last access) once `MAX_ENTRIES` is exceeded, and every entry expires after
+the TTL configured for the agent that produced it (falling back to `TTL`).
+A TTL of 0 disables caching for that agent.
+
+Calls made under `retry_wrapper` don't write straight away: their responses
+are held in a `PendingResponses` until the agent has validated them.
+"""
+
+# The `PendingResponses` open on each agent thread
+pending = threading.local()
+
+
+class PromptCache:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_cache()
+        return cls._instance
+
+    def _init_cache(self):
+        config = Config()
+        self.path = config.get_llm_cache_path()
+        self.max_entries = config.get_llm_cache_max_entries()
+        self.default_ttl = config.get_llm_cache_ttl()
+        self.agent_ttl = config.get_llm_cache_agent_ttl()
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prompt_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                agent TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_cache_accessed ON prompt_cache (accessed_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{model_id}:{digest}"
+
+    def ttl_for(self, agent: Optional[str]) -> int:
+        if agent and agent in self.agent_ttl:
+            return int(self.agent_ttl[agent])
+        return int(self.default_ttl)
+
+    def get(self, model_id: str, prompt: str, agent: Optional[str] = None) -> Optional[str]:
+        ttl = self.ttl_for(agent)
+        if ttl <= 0:
+            return None
+
+        key = self.make_key(model_id, prompt)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > ttl:
+                if row is not None:
+                    self.conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE prompt_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, model_id: str, prompt: str, response: str, agent: Optional[str] = None):
+        if self.ttl_for(agent) <= 0:
+            return
+
+        key = self.make_key(model_id, prompt)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, model, agent, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_id, agent, response, now, now)
+            )
+            self.conn.execute(
+                "DELETE FROM prompt_cache WHERE key IN ("
+                "SELECT key FROM prompt_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def delete(self, model_id: str, prompt: str):
+        key = self.make_key(model_id, prompt)
+        with self.lock:
+            self.conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class PendingResponses:
+    """
+    Cache writes held back for one attempt of an agent call. Accepted ones are
+    stored, rejected ones are dropped along with any cache hit the agent turned
+    down, so a malformed answer is never served again.
+    """
+
+    def __init__(self):
+        self.responses = []
+
+    def __enter__(self):
+        self.outer = getattr(pending, "responses", None)
+        pending.responses = self
+        return self
+
+    def __exit__(self, *exc_info):
+        pending.responses = self.outer
+
+    @staticmethod
+    def current():
+        return getattr(pending, "responses", None)
+
+    def add(self, cache: PromptCache, model_id: str, prompt: str, response: str, agent: Optional[str], hit: bool):
+        self.responses.append((cache, model_id, prompt, response, agent, hit))
+
+    def accept(self):
+        for cache, model_id, prompt, response, agent, hit in self.responses:
+            if not hit:
+                cache.set(model_id, prompt, response, agent)
+        self.responses = []
+
+    def reject(self):
+        for cache, model_id, prompt, _, _, hit in self.responses:
+            if hit:
+                cache.delete(model_id, prompt)
+        self.responses = []
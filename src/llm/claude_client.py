@@ -1,4 +1,4 @@
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 
 from src.config import Config
 
@@ -9,18 +9,53 @@ class Claude:
         self.client = Anthropic(
             api_key=api_key,
         )
+        self.async_client = AsyncAnthropic(
+            api_key=api_key,
+        )
+        self.cache_usage = {}
 
-    def inference(self, model_id: str, prompt: str) -> str:
-        message = self.client.messages.create(
-            max_tokens=4096,
-            messages=[
+    def request(self, model_id: str, prompt: str, prefix: str = None) -> dict:
+        request = {
+            "max_tokens": 4096,
+            "messages": [
                 {
                     "role": "user",
                     "content": prompt.strip(),
                 }
             ],
-            model=model_id,
-            temperature=0
-        )
+            "model": model_id,
+            "temperature": 0
+        }
+        if prefix:
+            # Static template instructions go first so Anthropic can cache them
+            request["system"] = [
+                {
+                    "type": "text",
+                    "text": prefix.strip(),
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ]
+        return request
+
+    def record_usage(self, model_id: str, usage):
+        totals = self.cache_usage.setdefault(model_id, {"cache_read_tokens": 0, "cache_write_tokens": 0})
+        totals["cache_read_tokens"] += getattr(usage, "cache_read_input_tokens", None) or 0
+        totals["cache_write_tokens"] += getattr(usage, "cache_creation_input_tokens", None) or 0
+
+    def inference(self, model_id: str, prompt: str, prefix: str = None) -> str:
+        message = self.client.messages.create(**self.request(model_id, prompt, prefix))
+        self.record_usage(model_id, message.usage)
 
         return message.content[0].text
+
+    async def ainference(self, model_id: str, prompt: str, prefix: str = None) -> str:
+        message = await self.async_client.messages.create(**self.request(model_id, prompt, prefix))
+        self.record_usage(model_id, message.usage)
+
+        return message.content[0].text
+
+    def inference_stream(self, model_id: str, prompt: str, prefix: str = None):
+        with self.client.messages.stream(**self.request(model_id, prompt, prefix)) as stream:
+            for text in stream.text_stream:
+                yield text
+            self.record_usage(model_id, stream.get_final_message().usage)
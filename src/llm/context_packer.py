@@ -0,0 +1,118 @@
+import re
+import math
+
+import tiktoken
+
+from src.config import Config
+from src.filesystem.code_index import DEFINITION_PATTERN, STOP_WORDS
+
+"""
+Keeps `code_markdown` and conversation history inside a per-agent token budget.
+
+Messages are kept newest first. Project files are packed in relevance order,
+either as `CodeIndex` already ranked them or by overlap with the recent
+conversation, whole while they fit, then as an outline of their imports and
+definitions, then as a bare file name.
+"""
+
+TIKTOKEN_ENC = tiktoken.get_encoding("cl100k_base")
+
+WORD_PATTERN = re.compile(r"[a-z_][a-z0-9_]{2,}")
+IMPORT_PATTERN = re.compile(r"^\s*(import |from |use |#include)")
+
+
+class ContextPacker:
+    def __init__(self, model_name: str):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            self.encoding = TIKTOKEN_ENC
+
+        config = Config()
+        self.conversation_share = config.get_context_conversation_share()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    @staticmethod
+    def terms(text: str) -> list:
+        return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+    @staticmethod
+    def outline(code: str) -> str:
+        return "\n".join(
+            line for line in code.splitlines() if IMPORT_PATTERN.match(line) or DEFINITION_PATTERN.match(line)
+        )
+
+    def pack_messages(self, messages: list, budget: int) -> list:
+        """
+        Keep the newest messages that fit in `budget` tokens, in chronological order.
+        """
+        packed = []
+        used = 0
+        for message in reversed(messages):
+            tokens = self.count_tokens(message)
+            if packed and used + tokens > budget:
+                break
+            packed.append(message)
+            used += tokens
+
+        omitted = len(messages) - len(packed)
+        if omitted:
+            packed.append(f"({omitted} earlier messages omitted)")
+
+        return list(reversed(packed))
+
+    def rank_files(self, code_set: list, query: str) -> list:
+        query_terms = set(self.terms(query))
+        if not query_terms:
+            return list(code_set)
+
+        def score(file: dict) -> float:
+            file_terms = self.terms(file["code"])
+            counts = {}
+            for term in file_terms:
+                if term in query_terms:
+                    counts[term] = counts.get(term, 0) + 1
+            name_terms = set(self.terms(file["filename"]))
+            # Dampen long files so they don't win on volume alone
+            body = sum(1 + math.log(count) for count in counts.values()) / math.sqrt(len(file_terms) or 1)
+            return body + 2 * len(query_terms & name_terms)
+
+        return sorted(code_set, key=score, reverse=True)
+
+    def pack_code(self, code_set: list, query: str, budget: int, ranked: bool = False) -> list:
+        """
+        Pick the files most relevant to `query`, degrading to outlines and then
+        to file names once the `budget` runs out. A `ranked` code set is taken
+        in the order given.
+        """
+        packed = []
+        used = 0
+        for file in code_set if ranked else self.rank_files(code_set, query):
+            outline = self.outline(file["code"])
+            candidates = [file["code"]]
+            if outline and outline != file["code"]:
+                candidates.append(f"(outline)\n{outline}")
+
+            for code in candidates:
+                tokens = self.count_tokens(code) + self.count_tokens(file["filename"])
+                if used + tokens <= budget:
+                    # A whole file keeps its dict, and with it any cached rendering
+                    packed.append(file if code is file["code"] else {"filename": file["filename"], "code": code})
+                    used += tokens
+                    break
+            else:
+                packed.append({"filename": file["filename"], "code": "(omitted)"})
+
+        return packed
+
+    def pack(self, messages: list, code_set: list, budget: int, ranked: bool = False) -> tuple:
+        """
+        Split `budget` between conversation and code, returns `(messages, code_set)`.
+        Whatever the conversation doesn't use goes to the code.
+        """
+        conversation = self.pack_messages(messages, int(budget * self.conversation_share))
+        used = sum(self.count_tokens(message) for message in conversation)
+        query = "\n".join(messages[-3:])
+        return conversation, self.pack_code(code_set, query, budget - used, ranked)
@@ -3,22 +3,35 @@ from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 from src.config import Config
 
+# Set safety settings for the request
+SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    # You can adjust other categories as needed
+}
+
 class Gemini:
     def __init__(self):
         config = Config()
         api_key = config.get_gemini_api_key()
         genai.configure(api_key=api_key)
 
-    def inference(self, model_id: str, prompt: str) -> str:
+    def model(self, model_id: str):
         config = genai.GenerationConfig(temperature=0)
-        model = genai.GenerativeModel(model_id, generation_config=config)
-        # Set safety settings for the request
-        safety_settings = {
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            # You can adjust other categories as needed
-        }
-        response = model.generate_content(prompt, safety_settings=safety_settings)
+        return genai.GenerativeModel(model_id, generation_config=config)
+
+    def inference(self, model_id: str, prompt: str) -> str:
+        model = self.model(model_id)
+        response = model.generate_content(prompt, safety_settings=SAFETY_SETTINGS)
+        return self.response_text(response)
+
+    async def ainference(self, model_id: str, prompt: str) -> str:
+        model = self.model(model_id)
+        response = await model.generate_content_async(prompt, safety_settings=SAFETY_SETTINGS)
+        return self.response_text(response)
+
+    @staticmethod
+    def response_text(response) -> str:
         try:
             # Check if the response contains text
             return response.text
@@ -31,3 +44,14 @@ class Gemini:
             print("Safety ratings:", response.candidates[0].safety_ratings)
             # Handle the error or return an appropriate message
             return "Error: Unable to generate content Gemini API"
+
+    def inference_stream(self, model_id: str, prompt: str):
+        model = self.model(model_id)
+        response = model.generate_content(prompt, safety_settings=SAFETY_SETTINGS, stream=True)
+        for chunk in response:
+            try:
+                yield chunk.text
+            except ValueError:
+                print("Prompt feedback:", response.prompt_feedback)
+                yield "Error: Unable to generate content Gemini API"
+                return
@@ -1,4 +1,4 @@
-from groq import Groq as _Groq
+from groq import Groq as _Groq, AsyncGroq
 
 from src.config import Config
 
@@ -8,6 +8,7 @@ class Groq:
         config = Config()
         api_key = config.get_groq_api_key()
         self.client = _Groq(api_key=api_key)
+        self.async_client = AsyncGroq(api_key=api_key)
 
     def inference(self, model_id: str, prompt: str) -> str:
         chat_completion = self.client.chat.completions.create(
@@ -22,3 +23,32 @@ class Groq:
         )
 
         return chat_completion.choices[0].message.content
+
+    async def ainference(self, model_id: str, prompt: str) -> str:
+        chat_completion = await self.async_client.chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt.strip(),
+                }
+            ],
+            model=model_id,
+            temperature=0
+        )
+        return chat_completion.choices[0].message.content
+
+    def inference_stream(self, model_id: str, prompt: str):
+        with self.client.chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt.strip(),
+                }
+            ],
+            model=model_id,
+            temperature=0,
+            stream=True
+        ) as stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
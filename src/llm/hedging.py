@@ -0,0 +1,49 @@
+import math
+import threading
+from collections import deque
+
+from src.config import Config
+
+"""
+Latency bookkeeping for hedged requests.
+
+Call latencies are kept per model in a rolling window. Calls cancelled as the
+losing side of a hedge or cut off by the timeout count with the time they had
+run, so a slow model's percentile doesn't drift low. Once a model has
+`MIN_SAMPLES` of them, the hedge fires after the configured percentile of
+that window; before that it falls back to `DEFAULT_DELAY` seconds.
+"""
+
+WINDOW = 200
+
+
+class LatencyTracker:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.latencies = {}
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def record(self, model: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(model, deque(maxlen=WINDOW)).append(seconds)
+
+    def samples(self, model: str) -> list:
+        with self.lock:
+            return list(self.latencies.get(model, ()))
+
+    def percentile(self, model: str, percentile: float):
+        samples = sorted(self.samples(model))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, math.ceil(percentile / 100 * len(samples)) - 1)
+        return samples[max(index, 0)]
+
+    def hedge_delay(self, model: str) -> float:
+        config = Config()
+        if len(self.samples(model)) < config.get_hedging_min_samples():
+            return config.get_hedging_default_delay()
+        return self.percentile(model, config.get_hedging_percentile())
@@ -1,34 +1,70 @@
-import sys
+import time
+import asyncio
+import threading
+import concurrent.futures
 
 import tiktoken
 from typing import List, Tuple
 
 from src.socket_instance import emit_agent
-from .ollama_client import Ollama
-from .claude_client import Claude
-from .openai_client import OpenAi
-from .gemini_client import Gemini
-from .mistral_client import MistralAi
-from .groq_client import Groq
+from .registry import ClientRegistry
+from .cache import PromptCache, PendingResponses
+from .ticker import InferenceTicker
+from .loop import InferenceLoop
+from .scheduler import InferenceScheduler, rate_limit_retry_after
+from .hedging import LatencyTracker
 
-from src.state import AgentState
+from src.token_usage import TokenUsage
 
 from src.config import Config
 from src.logger import Logger
 
 TIKTOKEN_ENC = tiktoken.get_encoding("cl100k_base")
 
-ollama = Ollama()
+registry = ClientRegistry()
+ticker = InferenceTicker()
+inference_loop = InferenceLoop()
+scheduler = InferenceScheduler()
+latencies = LatencyTracker()
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=64, thread_name_prefix="inference")
 logger = Logger()
-agentState = AgentState()
+tokenUsage = TokenUsage()
 config = Config()
 
+RATE_LIMIT_RETRIES = 3
+
+# Templates mark where their static instructions begin, providers that support
+# prompt caching get that part as a separate, cacheable leading block once it's
+# long enough for them to cache it at all
+PROMPT_CACHE_BREAK = "<<cache-break>>"
+PREFIX_CACHE_MIN_TOKENS = {"CLAUDE": 1024, "OPENAI": 1024}
+HAIKU_PREFIX_CACHE_MIN_TOKENS = 2048
+
+# Per-provider limits on in-flight requests, only touched from the inference loop
+provider_semaphores = {}
+
+
+def provider_semaphore(model_enum: str) -> asyncio.Semaphore:
+    if model_enum not in provider_semaphores:
+        provider_semaphores[model_enum] = asyncio.Semaphore(config.get_provider_concurrency(model_enum))
+    return provider_semaphores[model_enum]
+
+
+class InferenceError(Exception):
+    pass
+
+
+class InferenceTimeoutError(InferenceError):
+    pass
+
 
 class LLM:
-    def __init__(self, model_id: str = None):
+    def __init__(self, model_id: str = None, agent: str = None):
         self.model_id = model_id
+        self.agent = agent
         self.log_prompts = config.get_logging_prompts()
         self.timeout_inference = config.get_timeout_inference()
+        self.cache = PromptCache() if config.get_llm_cache_enabled() else None
         self.models = {
             "CLAUDE": [
                 ("Claude 3 Opus", "claude-3-opus-20240229"),
@@ -59,6 +95,7 @@ class LLM:
             ],
             "OLLAMA": []
         }
+        ollama = registry.get("OLLAMA")
         if ollama.client:
             self.models["OLLAMA"] = [(model["name"], model["name"]) for model in ollama.models]
 
@@ -73,75 +110,422 @@ class LLM:
         }
         return model_dict.get(model_name, (None, None))
 
-    @staticmethod
-    def update_global_token_usage(string: str, project_name: str):
+    def update_global_token_usage(self, string: str, project_name: str, model_name: str, kind: str) -> int:
         token_usage = len(TIKTOKEN_ENC.encode(string))
-        agentState.update_token_usage(project_name, token_usage)
+        total = tokenUsage.add(project_name, token_usage, agent=self.agent, model=model_name, kind=kind)
+        emit_agent("tokens", {"project_name": project_name, "token_usage": total})
+
+        return token_usage
+
+    @staticmethod
+    def scheduler_metrics() -> dict:
+        async def collect():
+            return scheduler.metrics()
+
+        return inference_loop.run(collect())
+
+    @staticmethod
+    def prompt_cache_metrics() -> dict:
+        return {
+            model_enum: client.cache_usage
+            for model_enum, client in registry.built().items()
+            if model_enum in PREFIX_CACHE_MIN_TOKENS
+        }
+
+    def cached_response(self, model_name: str, prompt: str, responses: PendingResponses = None):
+        if not self.cache:
+            return None
 
-        total = agentState.get_latest_token_usage(project_name) + token_usage
-        emit_agent("tokens", {"token_usage": total})
+        cached = self.cache.get(model_name, prompt, self.agent)
+        if cached is not None:
+            logger.info(f"LLM cache hit ({self.agent}): {self.cache.hits} hits, {self.cache.misses} misses")
+            if responses is not None:
+                responses.add(self.cache, model_name, prompt, cached, self.agent, True)
+        return cached
 
-    def inference(self, prompt: str, project_name: str) -> str:
-        self.update_global_token_usage(prompt, project_name)
+    def cache_response(self, model_name: str, prompt: str, response: str, responses: PendingResponses = None):
+        if not self.cache:
+            return
 
+        if responses is not None:
+            responses.add(self.cache, model_name, prompt, response, self.agent, False)
+        else:
+            self.cache.set(model_name, prompt, response, self.agent)
+
+    @staticmethod
+    def split_prompt(model_enum: str, model_name: str, prompt: str) -> tuple:
+        """
+        Returns `(prompt, kwargs)` for the provider call. Providers with prompt
+        caching get the static template tail as `prefix` if it reaches their
+        minimum cacheable length, otherwise the prompt goes out as rendered.
+        """
+        variable, marker, static = prompt.partition(PROMPT_CACHE_BREAK)
+        if not marker:
+            return prompt, {}
+
+        static = static.removeprefix("\n")
+        min_tokens = PREFIX_CACHE_MIN_TOKENS.get(model_enum)
+        if min_tokens and "haiku" in model_name.lower():
+            min_tokens = HAIKU_PREFIX_CACHE_MIN_TOKENS
+        # A shorter prefix is never cached, moving it ahead of the conversation would gain nothing
+        if min_tokens and len(TIKTOKEN_ENC.encode(static, disallowed_special=())) >= min_tokens:
+            return variable, {"prefix": static}
+        return variable + static, {}
+
+    def emit_stream(self, project_name: str, token: str, start: bool = False, done: bool = False):
+        """
+        Forward streamed output to the UI, `start` replaces what it shows so far
+        and `done` marks the completion as finished.
+        """
+        emit_agent("inference-stream", {
+            "project_name": project_name,
+            "agent": self.agent,
+            "token": token,
+            "start": start,
+            "done": done
+        }, False)
+
+    def stream_tokens(self, model_enum: str, model, model_name: str, prompt: str, project_name: str,
+                      stop: threading.Event = None, emit: bool = True):
+        """
+        Yield tokens from the provider as they arrive and forward each one to the UI.
+        Once `stop` is set the provider stream is closed and nothing more is yielded.
+        """
+        prompt, kwargs = self.split_prompt(model_enum, model_name, prompt)
+        stream = model.inference_stream(model_name, prompt, **kwargs)
+        try:
+            start = True
+            for token in stream:
+                if stop is not None and stop.is_set():
+                    return
+                if emit:
+                    self.emit_stream(project_name, token, start=start)
+                start = False
+                yield token
+        finally:
+            stream.close()
+        if emit:
+            self.emit_stream(project_name, "", done=True)
+
+    def collect_stream(self, model_enum: str, model, model_name: str, prompt: str, project_name: str,
+                       stop: threading.Event = None, emit: bool = True) -> str:
+        return "".join(self.stream_tokens(model_enum, model, model_name, prompt, project_name, stop, emit))
+
+    def inference_stream(self, prompt: str, project_name: str):
+        """
+        Streaming counterpart of `inference`, yields the completion token by token.
+        """
         model_enum, model_name = self.model_enum(self.model_id)
-                
+        if model_enum is None:
+            raise ValueError(f"Model {self.model_id} not supported")
+
+        responses = PendingResponses.current()
+        cached = self.cached_response(model_name, prompt, responses)
+        if cached is not None:
+            self.emit_stream(project_name, cached, start=True, done=True)
+            yield cached
+            return
+
+        prompt_tokens = self.update_global_token_usage(prompt, project_name, model_name, "prompt")
+
+        model = registry.get(model_enum)
+        inference_loop.run(scheduler.acquire(model_enum, model_name, prompt_tokens, self.agent))
+        tokens = []
+        for token in self.stream_tokens(model_enum, model, model_name, prompt, project_name):
+            tokens.append(token)
+            yield token
+
+        response = "".join(tokens).strip()
+        completion_tokens = self.update_global_token_usage(response, project_name, model_name, "completion")
+        inference_loop.call_soon(scheduler.record, model_enum, model_name, completion_tokens)
+
+        self.cache_response(model_name, prompt, response, responses)
+
+    async def ainference(self, prompt: str, project_name: str, responses: PendingResponses = None) -> str:
+        """
+        Native async inference, many of these can be in flight on one event loop.
+        """
+        model_enum, model_name = self.model_enum(self.model_id)
+
         print(f"Model: {self.model_id}, Enum: {model_enum}")
         if model_enum is None:
             raise ValueError(f"Model {self.model_id} not supported")
 
-        model_mapping = {
-            "OLLAMA": ollama,
-            "CLAUDE": Claude(),
-            "OPENAI": OpenAi(),
-            "GOOGLE": Gemini(),
-            "MISTRAL": MistralAi(),
-            "GROQ": Groq()
-        }
+        cached = await asyncio.to_thread(self.cached_response, model_name, prompt, responses)
+        if cached is not None:
+            return cached
+
+        prompt_tokens = await asyncio.to_thread(self.update_global_token_usage, prompt, project_name, model_name, "prompt")
 
+        fallback = config.get_hedging_fallback(self.agent)
         try:
-            import concurrent.futures
-            import time
-
-            start_time = time.time()
-            model = model_mapping[model_enum]
-            
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(model.inference, model_name, prompt)
-                try:
-                    while True:
-                        elapsed_time = time.time() - start_time
-                        elapsed_seconds = format(elapsed_time, ".2f")
-                        emit_agent("inference", {"type": "time", "elapsed_time": elapsed_seconds})
-                        if int(elapsed_time) == 5:
-                            emit_agent("inference", {"type": "warning", "message": "Inference is taking longer than expected"})
-                        if elapsed_time > self.timeout_inference:
-                            raise concurrent.futures.TimeoutError
-                        if future.done():
-                            break
-                        time.sleep(0.5)
-
-                    response = future.result(timeout=self.timeout_inference).strip()
-
-                except concurrent.futures.TimeoutError:
-                    logger.error(f"Inference failed. took too long. Model: {model_enum}, Model ID: {self.model_id}")
-                    emit_agent("inference", {"type": "error", "message": "Inference took too long. Please try again."})
-                    response = False
-                    sys.exit()
-                
-                except Exception as e:
-                    logger.error(str(e))
-                    response = False
-                    emit_agent("inference", {"type": "error", "message": str(e)})
-                    sys.exit()
+            if fallback and fallback != self.model_id:
+                response, answered_enum, answered_name = await self.hedged_call(
+                    model_enum, model_name, fallback, prompt, prompt_tokens, project_name
+                )
+            else:
+                response, answered_enum, answered_name = await self.call_provider(
+                    model_enum, model_name, prompt, prompt_tokens
+                )
+        except InferenceTimeoutError:
+            emit_agent("inference", {"type": "error", "message": "Inference took too long. Please try again."})
+            raise
+        except InferenceError as e:
+            emit_agent("inference", {"type": "error", "message": str(e)})
+            raise
+
+        response = response.strip()
+
+        if self.log_prompts:
+            logger.debug(f"Response ({answered_name}): --> {response}")
+
+        completion_tokens = await asyncio.to_thread(
+            self.update_global_token_usage, response, project_name, answered_name, "completion"
+        )
+        scheduler.record(answered_enum, answered_name, completion_tokens)
+
+        await asyncio.to_thread(self.cache_response, model_name, prompt, response, responses)
+
+        return response
 
+    async def call_provider(self, model_enum: str, model_name: str, prompt: str, prompt_tokens: int) -> tuple:
+        try:
+            model = registry.get(model_enum)
+        except KeyError:
+            raise ValueError(f"Model {model_enum} not supported")
+
+        provider_prompt, kwargs = self.split_prompt(model_enum, model_name, prompt)
+
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            await scheduler.acquire(model_enum, model_name, prompt_tokens, self.agent)
+
+            tick_id = ticker.start()
+            start_time = time.monotonic()
+            try:
+                response = await asyncio.wait_for(model.ainference(model_name, provider_prompt, **kwargs), timeout=self.timeout_inference)
+                latencies.record(model_name, time.monotonic() - start_time)
+                return response, model_enum, model_name
+            except asyncio.CancelledError:
+                # Lost a hedge, it was at least this slow
+                latencies.record(model_name, time.monotonic() - start_time)
+                raise
+            except asyncio.TimeoutError:
+                latencies.record(model_name, time.monotonic() - start_time)
+                logger.error(f"Inference failed. took too long. Model: {model_enum}, Model ID: {model_name}")
+                raise InferenceTimeoutError(f"Inference exceeded {self.timeout_inference}s for {model_name}")
+            except Exception as e:
+                retry_after = rate_limit_retry_after(e)
+                if retry_after is not None and attempt < RATE_LIMIT_RETRIES:
+                    # Back off through the scheduler instead of re-firing straight away
+                    logger.warning(f"Rate limited by {model_enum}, backing off {retry_after}s")
+                    scheduler.rate_limited(model_enum, model_name, retry_after)
+                    continue
+                logger.error(str(e))
+                raise InferenceError(str(e)) from e
+            finally:
+                ticker.stop(tick_id)
+
+    async def hedged_call(self, model_enum: str, model_name: str, fallback: str, prompt: str, prompt_tokens: int,
+                          project_name: str) -> tuple:
+        """
+        Fire the prompt at the fallback model once the primary is slower than its
+        usual latency percentile, keep whichever answers first and cancel the other.
+        The fallback's copy of the prompt is charged to the fallback model.
+        """
+        primary = asyncio.ensure_future(self.call_provider(model_enum, model_name, prompt, prompt_tokens))
+        done, _ = await asyncio.wait({primary}, timeout=latencies.hedge_delay(model_name))
+        if done:
+            return primary.result()
+
+        fallback_enum, fallback_name = self.model_enum(fallback)
+        if fallback_enum is None:
+            logger.warning(f"Hedging fallback {fallback} not supported, waiting on {self.model_id}")
+            return await primary
+
+        logger.info(f"Hedging {self.agent} request: {self.model_id} is slow, also trying {fallback}")
+        await asyncio.to_thread(self.update_global_token_usage, prompt, project_name, fallback_name, "prompt")
+        secondary = asyncio.ensure_future(self.call_provider(fallback_enum, fallback_name, prompt, prompt_tokens))
+
+        pending = {primary, secondary}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    return task.result()
+
+        # Both failed, surface the primary model's error
+        return primary.result()
+
+    async def ainference_many(self, prompts: List[str], project_name: str, max_concurrency: int = None) -> list:
+        """
+        Run independent prompts concurrently, results come back in prompt order.
+        A failed prompt leaves its exception in place of the response.
+        """
+        model_enum, _ = self.model_enum(self.model_id)
+        if model_enum is None:
+            raise ValueError(f"Model {self.model_id} not supported")
+
+        provider_limit = provider_semaphore(model_enum)
+        call_limit = asyncio.Semaphore(max_concurrency or max(len(prompts), 1))
+
+        async def run(prompt: str) -> str:
+            async with call_limit, provider_limit:
+                return await self.ainference(prompt, project_name)
+
+        results = await asyncio.gather(*(run(prompt) for prompt in prompts), return_exceptions=True)
+
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.error(f"Batched inference {index + 1}/{len(prompts)} failed: {result}")
 
+        return results
+
+    def inference_many(self, prompts: List[str], project_name: str, max_concurrency: int = None) -> list:
+        return inference_loop.run(self.ainference_many(prompts, project_name, max_concurrency))
+
+    def stream_call(self, model_enum: str, model_name: str, prompt: str, prompt_tokens: int, project_name: str,
+                    cancel: threading.Event = None, emit: bool = True) -> tuple:
+        """
+        Stream one completion on a worker thread and block until it's complete,
+        backing off through the scheduler and retrying when the provider rate limits.
+        Setting `cancel` abandons the call, `emit` False keeps its tokens from the UI.
+        """
+        try:
+            model = registry.get(model_enum)
         except KeyError:
             raise ValueError(f"Model {model_enum} not supported")
 
+        stop = cancel or threading.Event()
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            inference_loop.run(scheduler.acquire(model_enum, model_name, prompt_tokens, self.agent))
+            if stop.is_set():
+                raise InferenceError(f"Inference on {model_name} was cancelled")
+
+            future = executor.submit(self.collect_stream, model_enum, model, model_name, prompt, project_name, stop, emit)
+
+            tick_id = ticker.start()
+            start_time = time.monotonic()
+            try:
+                done, _ = concurrent.futures.wait([future], timeout=self.timeout_inference)
+            finally:
+                ticker.stop(tick_id)
+
+            if not done:
+                # The worker is already running so it can't be cancelled, have it close the stream instead
+                stop.set()
+                latencies.record(model_name, time.monotonic() - start_time)
+                logger.error(f"Inference failed. took too long. Model: {model_enum}, Model ID: {model_name}")
+                raise InferenceTimeoutError(f"Inference exceeded {self.timeout_inference}s for {model_name}")
+
+            try:
+                response = future.result()
+            except Exception as e:
+                retry_after = rate_limit_retry_after(e)
+                if retry_after is not None and attempt < RATE_LIMIT_RETRIES:
+                    logger.warning(f"Rate limited by {model_enum}, backing off {retry_after}s")
+                    inference_loop.call_soon(scheduler.rate_limited, model_enum, model_name, retry_after)
+                    continue
+                logger.error(str(e))
+                raise InferenceError(str(e)) from e
+
+            latencies.record(model_name, time.monotonic() - start_time)
+            if stop.is_set():
+                # The provider still produced whatever streamed before the cancel
+                completion_tokens = self.update_global_token_usage(response, project_name, model_name, "completion")
+                inference_loop.call_soon(scheduler.record, model_enum, model_name, completion_tokens)
+                raise InferenceError(f"Inference on {model_name} was cancelled")
+            return response, model_enum, model_name
+
+    def hedged_stream(self, model_enum: str, model_name: str, fallback: str, prompt: str, prompt_tokens: int,
+                      project_name: str) -> tuple:
+        """
+        Streaming counterpart of `hedged_call`. The fallback streams silently and,
+        if it wins, its whole completion replaces the primary's partial output in the UI.
+        The loser's partial completion is charged when its stream is cancelled.
+        """
+        cancels = {}
+
+        def start(enum: str, name: str, emit: bool):
+            cancel = threading.Event()
+            future = executor.submit(self.stream_call, enum, name, prompt, prompt_tokens, project_name, cancel, emit)
+            cancels[future] = cancel
+            return future
+
+        primary = start(model_enum, model_name, True)
+        done, _ = concurrent.futures.wait([primary], timeout=latencies.hedge_delay(model_name))
+        if done:
+            return primary.result()
+
+        fallback_enum, fallback_name = self.model_enum(fallback)
+        if fallback_enum is None:
+            logger.warning(f"Hedging fallback {fallback} not supported, waiting on {self.model_id}")
+            return primary.result()
+
+        logger.info(f"Hedging {self.agent} request: {self.model_id} is slow, also trying {fallback}")
+        self.update_global_token_usage(prompt, project_name, fallback_name, "prompt")
+        secondary = start(fallback_enum, fallback_name, False)
+
+        pending = {primary, secondary}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        cancels[loser].set()
+                    response = future.result()
+                    if future is secondary:
+                        self.emit_stream(project_name, response[0], start=True, done=True)
+                    return response
+
+        # Both failed, surface the primary model's error
+        return primary.result()
+
+    def inference(self, prompt: str, project_name: str, stream: bool = False) -> str:
+        # Taken on the calling thread, the agent's `retry_wrapper` attempt
+        responses = PendingResponses.current()
+        if not stream:
+            return inference_loop.run(self.ainference(prompt, project_name, responses))
+
+        model_enum, model_name = self.model_enum(self.model_id)
+                
+        print(f"Model: {self.model_id}, Enum: {model_enum}")
+        if model_enum is None:
+            raise ValueError(f"Model {self.model_id} not supported")
+
+        cached = self.cached_response(model_name, prompt, responses)
+        if cached is not None:
+            self.emit_stream(project_name, cached, start=True, done=True)
+            return cached
+
+        prompt_tokens = self.update_global_token_usage(prompt, project_name, model_name, "prompt")
+
+        fallback = config.get_hedging_fallback(self.agent)
+        try:
+            if fallback and fallback != self.model_id:
+                response, answered_enum, answered_name = self.hedged_stream(
+                    model_enum, model_name, fallback, prompt, prompt_tokens, project_name
+                )
+            else:
+                response, answered_enum, answered_name = self.stream_call(
+                    model_enum, model_name, prompt, prompt_tokens, project_name
+                )
+        except InferenceTimeoutError:
+            emit_agent("inference", {"type": "error", "message": "Inference took too long. Please try again."})
+            raise
+        except InferenceError as e:
+            emit_agent("inference", {"type": "error", "message": str(e)})
+            raise
+
+        response = response.strip()
+
         if self.log_prompts:
-            logger.debug(f"Response ({model}): --> {response}")
+            logger.debug(f"Response ({answered_name}): --> {response}")
+
+        completion_tokens = self.update_global_token_usage(response, project_name, answered_name, "completion")
+        inference_loop.call_soon(scheduler.record, answered_enum, answered_name, completion_tokens)
 
-        self.update_global_token_usage(response, project_name)
+        self.cache_response(model_name, prompt, response, responses)
 
         return response
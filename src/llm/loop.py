@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+"""
+Background asyncio loop shared by every async provider client.
+
+Async SDK clients bind their connection pools to the loop they first run on,
+so all coroutines go through this one loop rather than a fresh `asyncio.run`.
+"""
+
+
+class InferenceLoop:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.loop = asyncio.new_event_loop()
+            cls._instance.thread = threading.Thread(target=cls._instance.loop.run_forever, daemon=True)
+            cls._instance.thread.start()
+        return cls._instance
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the loop, returns a `concurrent.futures.Future`.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """
+        Run a plain callback on the loop thread, for state owned by the loop.
+        """
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def run(self, coro):
+        """
+        Run a coroutine on the loop and block the calling thread until it finishes.
+        """
+        return self.submit(coro).result()
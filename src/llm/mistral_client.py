@@ -1,4 +1,5 @@
 from mistralai.client import MistralClient
+from mistralai.async_client import MistralAsyncClient
 from mistralai.models.chat_completion import ChatMessage
 
 from src.config import Config
@@ -9,6 +10,7 @@ class MistralAi:
         config = Config()
         api_key = config.get_mistral_api_key()
         self.client = MistralClient(api_key=api_key)
+        self.async_client = MistralAsyncClient(api_key=api_key)
 
     def inference(self, model_id: str, prompt: str) -> str:
         print("prompt", prompt.strip())
@@ -20,3 +22,28 @@ class MistralAi:
             temperature=0
         )
         return chat_completion.choices[0].message.content
+
+    async def ainference(self, model_id: str, prompt: str) -> str:
+        chat_completion = await self.async_client.chat(
+            model=model_id,
+            messages=[
+                ChatMessage(role="user", content=prompt.strip())
+            ],
+            temperature=0
+        )
+        return chat_completion.choices[0].message.content
+
+    def inference_stream(self, model_id: str, prompt: str):
+        stream = self.client.chat_stream(
+            model=model_id,
+            messages=[
+                ChatMessage(role="user", content=prompt.strip())
+            ],
+            temperature=0
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
@@ -9,10 +9,12 @@ class Ollama:
     def __init__(self):
         try:
             self.client = ollama.Client(Config().get_ollama_api_endpoint())
+            self.async_client = ollama.AsyncClient(Config().get_ollama_api_endpoint())
             self.models = self.client.list()["models"]
             log.info("Ollama available")
         except:
             self.client = None
+            self.async_client = None
             log.warning("Ollama not available")
             log.warning("run ollama server to use ollama models otherwise use API models")
 
@@ -23,3 +25,25 @@ class Ollama:
             options={"temperature": 0}
         )
         return response['response']
+
+    async def ainference(self, model_id: str, prompt: str) -> str:
+        response = await self.async_client.generate(
+            model=model_id,
+            prompt=prompt.strip(),
+            options={"temperature": 0}
+        )
+        return response['response']
+
+    def inference_stream(self, model_id: str, prompt: str):
+        stream = self.client.generate(
+            model=model_id,
+            prompt=prompt.strip(),
+            options={"temperature": 0},
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk['response']:
+                    yield chunk['response']
+        finally:
+            stream.close()
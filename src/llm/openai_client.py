@@ -1,4 +1,4 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from src.config import Config
 
@@ -9,16 +9,56 @@ class OpenAi:
         api_key = config.get_openai_api_key()
         base_url = config.get_openai_api_base_url()
         self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        self.cache_usage = {}
 
-    def inference(self, model_id: str, prompt: str) -> str:
+    @staticmethod
+    def messages(prompt: str, prefix: str = None) -> list:
+        messages = [
+            {
+                "role": "user",
+                "content": prompt.strip(),
+            }
+        ]
+        if prefix:
+            # OpenAI caches repeated prompt prefixes automatically, so the
+            # static instructions lead as the system message
+            messages.insert(0, {"role": "system", "content": prefix.strip()})
+        return messages
+
+    def record_usage(self, model_id: str, usage):
+        totals = self.cache_usage.setdefault(model_id, {"cache_read_tokens": 0})
+        details = getattr(usage, "prompt_tokens_details", None)
+        totals["cache_read_tokens"] += getattr(details, "cached_tokens", None) or 0
+
+    def inference(self, model_id: str, prompt: str, prefix: str = None) -> str:
         chat_completion = self.client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt.strip(),
-                }
-            ],
+            messages=self.messages(prompt, prefix),
             model=model_id,
             temperature=0
         )
+        self.record_usage(model_id, chat_completion.usage)
         return chat_completion.choices[0].message.content
+
+    async def ainference(self, model_id: str, prompt: str, prefix: str = None) -> str:
+        chat_completion = await self.async_client.chat.completions.create(
+            messages=self.messages(prompt, prefix),
+            model=model_id,
+            temperature=0
+        )
+        self.record_usage(model_id, chat_completion.usage)
+        return chat_completion.choices[0].message.content
+
+    def inference_stream(self, model_id: str, prompt: str, prefix: str = None):
+        with self.client.chat.completions.create(
+            messages=self.messages(prompt, prefix),
+            model=model_id,
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True}
+        ) as stream:
+            for chunk in stream:
+                if chunk.usage:
+                    self.record_usage(model_id, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
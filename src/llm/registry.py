@@ -0,0 +1,67 @@
+import threading
+
+from .ollama_client import Ollama
+from .claude_client import Claude
+from .openai_client import OpenAi
+from .gemini_client import Gemini
+from .mistral_client import MistralAi
+from .groq_client import Groq
+
+from src.config import Config
+
+"""
+Process-wide registry of provider clients.
+
+Each client is built lazily on first use and then reused, so the SDK's HTTP
+connection pool stays warm across inferences. A client is rebuilt only when
+the config values it was built from (API key, endpoint) change, e.g. after
+`Config.update_config` from the settings page.
+"""
+
+PROVIDERS = {
+    "OLLAMA": (Ollama, lambda config: (config.get_ollama_api_endpoint(),)),
+    "CLAUDE": (Claude, lambda config: (config.get_claude_api_key(),)),
+    "OPENAI": (OpenAi, lambda config: (config.get_openai_api_key(), config.get_openai_api_base_url())),
+    "GOOGLE": (Gemini, lambda config: (config.get_gemini_api_key(),)),
+    "MISTRAL": (MistralAi, lambda config: (config.get_mistral_api_key(),)),
+    "GROQ": (Groq, lambda config: (config.get_groq_api_key(),)),
+}
+
+
+class ClientRegistry:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.clients = {}
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def get(self, model_enum: str):
+        if model_enum not in PROVIDERS:
+            raise KeyError(model_enum)
+
+        client_class, settings = PROVIDERS[model_enum]
+        current = settings(Config())
+
+        with self.lock:
+            entry = self.clients.get(model_enum)
+            if entry is None or entry[0] != current:
+                entry = (current, client_class())
+                self.clients[model_enum] = entry
+            return entry[1]
+
+    def built(self) -> dict:
+        """
+        Clients constructed so far, without building any new ones.
+        """
+        with self.lock:
+            return {model_enum: entry[1] for model_enum, entry in self.clients.items()}
+
+    def refresh(self, model_enum: str = None):
+        with self.lock:
+            if model_enum:
+                self.clients.pop(model_enum, None)
+            else:
+                self.clients.clear()
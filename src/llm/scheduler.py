@@ -0,0 +1,180 @@
+import time
+import heapq
+import asyncio
+import itertools
+
+from src.config import Config
+from src.logger import Logger
+
+"""
+Token-bucket rate limiting and priority scheduling for provider calls.
+
+Every (provider, model) pair gets a requests/minute and a tokens/minute bucket
+from the `[RATE_LIMITS]` config (a model id entry wins over its provider entry,
+0 or missing means unlimited). Calls waiting for capacity are queued by agent
+priority, so interactive agents jump ahead of background formatting work.
+All methods run on the shared inference loop.
+
+A prompt bigger than a whole minute of tokens waits for a full bucket and
+then empties it, rather than leaving a debt the calls behind it must wait out.
+
+A 429 blocks the pair until its retry-after has passed, whether or not it
+has limits configured.
+"""
+
+# Lower runs first
+AGENT_PRIORITY = {
+    "action": 0,
+    "answer": 0,
+    "decision": 0,
+    "formatter": 2,
+    "reporter": 2,
+}
+DEFAULT_PRIORITY = 1
+
+logger = Logger()
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+    def drain(self, seconds: float):
+        # Provider told us to back off, empty the bucket for that long
+        if self.capacity:
+            self.refill()
+            self.tokens = -seconds * self.rate
+
+
+class InferenceScheduler:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.buckets = {}
+            cls._instance.queues = {}
+            cls._instance.timers = {}
+            cls._instance.blocked_until = {}
+            cls._instance.stats = {}
+            cls._instance.sequence = itertools.count()
+        return cls._instance
+
+    def get_buckets(self, key: tuple) -> tuple:
+        if key not in self.buckets:
+            limits = Config().get_rate_limits(*key)
+            self.buckets[key] = (TokenBucket(limits.get("RPM", 0)), TokenBucket(limits.get("TPM", 0)))
+            self.queues[key] = []
+            self.stats[key] = {"requests": 0, "total_wait": 0.0, "max_wait": 0.0, "rate_limited": 0}
+        return self.buckets[key]
+
+    async def acquire(self, provider: str, model: str, tokens: int, agent: str = None):
+        """
+        Wait until the provider has capacity for one request of `tokens` prompt tokens.
+        """
+        key = (provider, model)
+        self.get_buckets(key)
+        priority = AGENT_PRIORITY.get(agent, DEFAULT_PRIORITY)
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+
+        heapq.heappush(self.queues[key], (priority, next(self.sequence), tokens, future))
+        self.dispatch(key)
+        await future
+
+        waited = time.monotonic() - enqueued
+        stats = self.stats[key]
+        stats["requests"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def dispatch(self, key: tuple):
+        self.timers.pop(key, None)
+        requests, tokens = self.buckets[key]
+        queue = self.queues[key]
+
+        while queue:
+            _, _, amount, future = queue[0]
+            if future.cancelled():
+                heapq.heappop(queue)
+                continue
+
+            blocked = self.blocked_until.get(key, 0.0) - time.monotonic()
+            wait = max(blocked, requests.wait_time(1), tokens.wait_time(amount))
+            if wait > 0:
+                if key not in self.timers:
+                    loop = asyncio.get_running_loop()
+                    self.timers[key] = loop.call_later(wait, self.dispatch, key)
+                return
+
+            heapq.heappop(queue)
+            if tokens.capacity and amount > tokens.capacity:
+                logger.warning(
+                    f"Prompt of {amount} tokens is over the {tokens.capacity} TPM limit for {'/'.join(key)}"
+                )
+            requests.consume(1)
+            tokens.consume(amount)
+            future.set_result(None)
+
+    def record(self, provider: str, model: str, tokens: int):
+        """
+        Charge completion tokens once the response size is known.
+        """
+        self.get_buckets((provider, model))[1].consume(tokens)
+
+    def rate_limited(self, provider: str, model: str, retry_after: float):
+        key = (provider, model)
+        for bucket in self.get_buckets(key):
+            bucket.drain(retry_after)
+        self.blocked_until[key] = max(self.blocked_until.get(key, 0.0), time.monotonic() + retry_after)
+        self.stats[key]["rate_limited"] += 1
+
+    def metrics(self) -> dict:
+        metrics = {}
+        for key, stats in self.stats.items():
+            requests = stats["requests"]
+            metrics["/".join(key)] = {
+                "queue_depth": len(self.queues[key]),
+                "requests": requests,
+                "avg_wait": round(stats["total_wait"] / requests, 3) if requests else 0.0,
+                "max_wait": round(stats["max_wait"], 3),
+                "rate_limited": stats["rate_limited"],
+            }
+        return metrics
+
+
+def rate_limit_retry_after(error: Exception):
+    """
+    Seconds to back off if `error` is a provider 429, otherwise None.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+    if status != 429:
+        return None
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 2))
+    except (TypeError, ValueError):
+        return 2.0
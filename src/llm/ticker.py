@@ -0,0 +1,57 @@
+import time
+import itertools
+import threading
+
+from src.socket_instance import emit_agent
+
+"""
+Single background ticker that reports elapsed time for every in-flight
+inference, so waiting on a provider never needs its own polling loop.
+"""
+
+TICK_INTERVAL = 0.5
+SLOW_INFERENCE_WARNING = 5
+
+
+class InferenceTicker:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.inflight = {}
+            cls._instance.ids = itertools.count()
+            cls._instance.condition = threading.Condition()
+            cls._instance.thread = None
+        return cls._instance
+
+    def start(self) -> int:
+        with self.condition:
+            tick_id = next(self.ids)
+            self.inflight[tick_id] = {"start": time.time(), "warned": False}
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+            return tick_id
+
+    def stop(self, tick_id: int):
+        with self.condition:
+            self.inflight.pop(tick_id, None)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.inflight:
+                    self.condition.wait()
+                inflight = list(self.inflight.values())
+
+            now = time.time()
+            for entry in inflight:
+                elapsed_time = now - entry["start"]
+                emit_agent("inference", {"type": "time", "elapsed_time": format(elapsed_time, ".2f")}, False)
+                if elapsed_time >= SLOW_INFERENCE_WARNING and not entry["warned"]:
+                    entry["warned"] = True
+                    emit_agent("inference", {"type": "warning", "message": "Inference is taking longer than expected"})
+
+            time.sleep(TICK_INTERVAL)
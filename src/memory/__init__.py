@@ -1 +1,2 @@
-from .knowledge_base import KnowledgeBase
\ No newline at end of file
+from .knowledge_base import KnowledgeBase
+from .research_cache import ResearchCache
\ No newline at end of file
@@ -1,33 +1,178 @@
+import re
 from typing import Optional
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlalchemy import text
+from sqlmodel import Field, Session, SQLModel
 
 from src.config import Config
+from src.database import get_engine
 
 """
-TODO: The tag check should be a BM25 search, it's just a simple equality check now.
+Researched content keyed by the query that produced it.
+
+An FTS5 index mirrors the `knowledge` table (kept in sync by triggers) and
+`search` ranks entries with BM25, weighting the tag over the contents. A
+hit's `relevance` is the Jaccard similarity of the query's and the tag's
+terms, so neither a short query nor a short tag matches a longer, more
+specific one. That's what callers compare against `[KNOWLEDGE] MIN_RELEVANCE`
+before treating it as a hit. The agent serves a hit's contents in place of
+searching only while the research cache still holds a fresh link for its tag,
+and entries are deleted when the research cache evicts their query, so
+`[RESEARCH_CACHE]` QUERY_TTL, MAX_ENTRIES and ENABLED govern this table too.
+Each tag holds one entry, storing under it again replaces the contents.
+
+With `[RAG] ENABLED`, tags are also embedded into a `VectorStore`, and
+`lookup` falls back to it to find research on a query that was phrased
+differently, at a cosine similarity of at least `[RAG] MIN_SCORE`.
 """
 
+TERM_PATTERN = re.compile(r"\w+")
+TAG_WEIGHT = 5.0
+CONTENTS_WEIGHT = 1.0
+RAG_COLLECTION = "knowledge"
+
+FTS_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts
+       USING fts5(tag, contents, content='knowledge', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS knowledge_ai AFTER INSERT ON knowledge BEGIN
+         INSERT INTO knowledge_fts(rowid, tag, contents) VALUES (new.id, new.tag, new.contents);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS knowledge_ad AFTER DELETE ON knowledge BEGIN
+         INSERT INTO knowledge_fts(knowledge_fts, rowid, tag, contents) VALUES ('delete', old.id, old.tag, old.contents);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS knowledge_au AFTER UPDATE ON knowledge BEGIN
+         INSERT INTO knowledge_fts(knowledge_fts, rowid, tag, contents) VALUES ('delete', old.id, old.tag, old.contents);
+         INSERT INTO knowledge_fts(rowid, tag, contents) VALUES (new.id, new.tag, new.contents);
+       END""",
+]
+
+
 class Knowledge(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    tag: str
+    tag: str = Field(index=True)
     contents: str
 
+
 class KnowledgeBase:
+    fts_ready = False
+
     def __init__(self):
-        config = Config()
-        sqlite_path = config.get_sqlite_db()
-        self.engine = create_engine(f"sqlite:///{sqlite_path}")
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_engine()
+        if not KnowledgeBase.fts_ready:
+            self.create_fts_index()
+            KnowledgeBase.fts_ready = True
+
+    def create_fts_index(self):
+        with Session(self.engine) as session:
+            exists = session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+            )).first()
+            for statement in FTS_SETUP:
+                session.execute(text(statement))
+            if not exists:
+                # Index rows stored before the FTS table existed
+                session.execute(text("INSERT INTO knowledge_fts(knowledge_fts) VALUES ('rebuild')"))
+            session.commit()
+
+    @staticmethod
+    def terms(query: str) -> list:
+        return list(dict.fromkeys(TERM_PATTERN.findall(query.lower())))
 
     def add_knowledge(self, tag: str, contents: str):
-        knowledge = Knowledge(tag=tag, contents=contents)
+        self.add_knowledge_many([(tag, contents)])
+
+    def add_knowledge_many(self, items: list):
+        """
+        Store `(tag, contents)` pairs in a single transaction, replacing whatever
+        was stored under the same tags.
+        """
+        if not items:
+            return
+        latest = dict(items)
         with Session(self.engine) as session:
-            session.add(knowledge)
+            session.query(Knowledge).filter(Knowledge.tag.in_(latest)).delete(synchronize_session=False)
+            session.add_all([Knowledge(tag=tag, contents=contents) for tag, contents in latest.items()])
             session.commit()
 
+        if Config().get_rag_enabled():
+            from src.memory.rag import VectorStore
+            VectorStore(RAG_COLLECTION).add_many([(tag, tag) for tag in latest])
+
+    def delete_knowledge_many(self, tags: list):
+        with Session(self.engine) as session:
+            session.query(Knowledge).filter(Knowledge.tag.in_(tags)).delete(synchronize_session=False)
+            session.commit()
+
+        if Config().get_rag_enabled():
+            from src.memory.rag import VectorStore
+            VectorStore(RAG_COLLECTION).delete_many(tags)
+
     def get_knowledge(self, tag: str) -> str:
         with Session(self.engine) as session:
             knowledge = session.query(Knowledge).filter(Knowledge.tag == tag).first()
             if knowledge:
                 return knowledge.contents
-            return None
\ No newline at end of file
+            return None
+
+    def search(self, query: str, k: int = 5, min_relevance: float = 0.0) -> list:
+        """
+        Best `k` entries for `query` by BM25, as dicts with tag, contents, score
+        and relevance, dropping those below `min_relevance`.
+        """
+        query_terms = self.terms(query)
+        if not query_terms:
+            return []
+
+        match = " OR ".join(f'"{term}"' for term in query_terms)
+        with Session(self.engine) as session:
+            rows = session.execute(text(
+                "SELECT knowledge.tag, knowledge.contents, "
+                "bm25(knowledge_fts, :tag_weight, :contents_weight) AS rank "
+                "FROM knowledge_fts JOIN knowledge ON knowledge.id = knowledge_fts.rowid "
+                "WHERE knowledge_fts MATCH :match ORDER BY rank LIMIT :limit"
+            ), {
+                "tag_weight": TAG_WEIGHT,
+                "contents_weight": CONTENTS_WEIGHT,
+                "match": match,
+                # Over-fetch so the relevance filter can still fill `k`
+                "limit": k * 4,
+            }).all()
+
+        query_terms = set(query_terms)
+        results = []
+        for tag, contents, rank in rows:
+            tag_terms = set(self.terms(tag))
+            relevance = len(query_terms & tag_terms) / len(query_terms | tag_terms)
+            if relevance >= min_relevance:
+                results.append({"tag": tag, "contents": contents, "score": -rank, "relevance": relevance})
+        return results[:k]
+
+    def lookup(self, query: str) -> Optional[dict]:
+        """
+        Best entry, as a dict with tag and contents, if it's relevant enough to
+        reuse instead of researching `query` again.
+        """
+        results = self.search(query, k=1, min_relevance=Config().get_knowledge_min_relevance())
+        if results:
+            return {"tag": results[0]["tag"], "contents": results[0]["contents"]}
+
+        tag = self.similar_tag(query)
+        if tag:
+            contents = self.get_knowledge(tag)
+            if contents is not None:
+                return {"tag": tag, "contents": contents}
+        return None
+
+    def similar_tag(self, query: str) -> Optional[str]:
+        """
+        Tag semantically closest to `query` in the vector store, if RAG is
+        enabled and it's close enough.
+        """
+        config = Config()
+        if not config.get_rag_enabled():
+            return None
+
+        from src.memory.rag import VectorStore
+        hits = VectorStore(RAG_COLLECTION).search(query, k=1)
+        if hits and hits[0]["score"] >= config.get_rag_min_score():
+            return hits[0]["doc_id"]
+        return None
@@ -1,3 +1,279 @@
+import os
+import json
+import threading
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import update
+from sqlmodel import Field, Session, SQLModel, Index
+
+from src.config import Config
+from src.database import get_engine
+from src.bert.embeddings import Embedder
+
 """
 Vector Search for Code Docs + Docs Loading
-"""
\ No newline at end of file
+
+Local vector store, one per named collection. Documents are split into
+overlapping word windows, embedded with the shared sentence-transformer and
+stored as float16 or int8 rows of a memory-mapped NumPy file under
+`[RAG] PATH/<collection>/`. Chunk text and row numbers live in SQLite.
+
+Search is an exact cosine top-k, computed block by block over the mapped
+file so memory stays flat however large the corpus gets. Deleting a
+document only marks its rows dead; the file is compacted in place, also
+block by block, once more than half of it is dead.
+"""
+
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+INITIAL_CAPACITY = 1024
+SEARCH_BLOCK_ROWS = 65536
+INT8_SCALE = 127.0
+
+
+class RagChunk(SQLModel, table=True):
+    __tablename__ = "rag_chunk"
+    __table_args__ = (
+        Index("ix_rag_chunk_collection_doc", "collection", "doc_id"),
+        Index("ix_rag_chunk_collection_row", "collection", "row"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    collection: str
+    doc_id: str
+    row: int
+    text: str
+
+
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> list:
+    words = text.split()
+    if not words:
+        return []
+
+    step = max(size - overlap, 1)
+    return [" ".join(words[start:start + size]) for start in range(0, max(len(words) - overlap, 1), step)]
+
+
+class VectorStore:
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, collection: str):
+        with cls._lock:
+            if collection not in cls._instances:
+                instance = super().__new__(cls)
+                instance.setup(collection)
+                cls._instances[collection] = instance
+            return cls._instances[collection]
+
+    def setup(self, collection: str):
+        config = Config()
+        self.collection = collection
+        self.dtype = np.int8 if config.get_rag_dtype() == "int8" else np.float16
+        self.directory = os.path.join(config.get_rag_path(), collection)
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.vectors_path = os.path.join(self.directory, "vectors.npy")
+        self.engine = get_engine()
+        self.embedder = Embedder()
+        self.lock = threading.RLock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.count = 0
+        self.vectors = None
+        if os.path.exists(self.meta_path) and os.path.exists(self.vectors_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta["dtype"] == np.dtype(self.dtype).name:
+                self.count = meta["count"]
+                self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+            else:
+                # Changing [RAG] DTYPE invalidates the stored rows
+                self.drop_rows()
+
+        self.live = np.zeros(self.capacity, dtype=bool)
+        with Session(self.engine) as session:
+            rows = session.query(RagChunk.row).filter(RagChunk.collection == collection).all()
+        for (row,) in rows:
+            if row < self.count:
+                self.live[row] = True
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    def drop_rows(self):
+        with Session(self.engine) as session:
+            session.query(RagChunk).filter(RagChunk.collection == self.collection).delete()
+            session.commit()
+
+    def save_meta(self):
+        with open(self.meta_path, "w") as f:
+            json.dump({"count": self.count, "dtype": np.dtype(self.dtype).name}, f)
+
+    def quantize(self, embeddings: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return np.clip(np.rint(embeddings * INT8_SCALE), -INT8_SCALE, INT8_SCALE).astype(np.int8)
+        return embeddings.astype(np.float16)
+
+    def reserve(self, rows: int, dimensions: int):
+        """
+        Make room for `rows` more vectors, doubling the mapped file as needed.
+        """
+        needed = self.count + rows
+        if needed <= self.capacity:
+            return
+
+        capacity = max(INITIAL_CAPACITY, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+
+        temporary_path = f"{self.vectors_path}.tmp"
+        grown = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=self.dtype, shape=(capacity, dimensions))
+        if self.vectors is not None:
+            grown[:self.count] = self.vectors[:self.count]
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(temporary_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+
+    def add(self, doc_id: str, text: str):
+        self.add_many([(doc_id, text)])
+
+    def add_many(self, documents: list):
+        """
+        Index `(doc_id, text)` pairs, replacing any earlier version of each document.
+        """
+        chunks = [(doc_id, chunk) for doc_id, text in documents for chunk in chunk_text(text)]
+        embeddings = self.embedder.encode([chunk for _, chunk in chunks]) if chunks else None
+
+        with self.lock:
+            self.delete_many([doc_id for doc_id, _ in documents], compact=False)
+            if chunks:
+                self.append(chunks, embeddings)
+            self.compact_if_sparse()
+
+    def append(self, chunks: list, embeddings: np.ndarray):
+        with self.lock:
+            self.reserve(len(chunks), embeddings.shape[1])
+
+            start = self.count
+            self.vectors[start:start + len(chunks)] = self.quantize(embeddings)
+            self.vectors.flush()
+            self.count += len(chunks)
+            self.live[start:self.count] = True
+            self.save_meta()
+
+            with Session(self.engine) as session:
+                session.add_all([
+                    RagChunk(collection=self.collection, doc_id=doc_id, row=start + offset, text=chunk)
+                    for offset, (doc_id, chunk) in enumerate(chunks)
+                ])
+                session.commit()
+
+    def delete(self, doc_id: str):
+        self.delete_many([doc_id])
+
+    def delete_many(self, doc_ids: list, compact: bool = True):
+        with self.lock:
+            with Session(self.engine) as session:
+                query = session.query(RagChunk).filter(
+                    RagChunk.collection == self.collection, RagChunk.doc_id.in_(doc_ids)
+                )
+                for chunk in query.all():
+                    self.live[chunk.row] = False
+                query.delete()
+                session.commit()
+
+            if compact:
+                self.compact_if_sparse()
+
+    def compact_if_sparse(self):
+        if self.count and self.live[:self.count].sum() < self.count / 2:
+            self.compact()
+
+    def compact(self):
+        """
+        Move the live rows to the front of the vectors file, a block at a time,
+        and renumber the chunks.
+        """
+        live_rows = np.flatnonzero(self.live[:self.count])
+        # Rows only ever move down, so copying in ascending order never reads a row already overwritten
+        for start in range(0, len(live_rows), SEARCH_BLOCK_ROWS):
+            block = live_rows[start:start + SEARCH_BLOCK_ROWS]
+            self.vectors[start:start + len(block)] = self.vectors[block]
+        if len(live_rows):
+            self.vectors.flush()
+
+        new_rows = {int(old): new for new, old in enumerate(live_rows)}
+        with Session(self.engine) as session:
+            chunks = session.query(RagChunk.id, RagChunk.row).filter(RagChunk.collection == self.collection).all()
+            if chunks:
+                session.execute(
+                    update(RagChunk),
+                    [{"id": chunk_id, "row": new_rows[row]} for chunk_id, row in chunks]
+                )
+            session.commit()
+
+        self.count = len(live_rows)
+        self.live[:] = False
+        self.live[:self.count] = True
+        self.save_meta()
+
+    def search(self, query: str, k: int = 5) -> list:
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: list, k: int = 5) -> list:
+        """
+        Top `k` chunks per query as dicts with doc_id, text and score (cosine).
+        """
+        if not queries:
+            return []
+
+        query_vectors = self.embedder.encode(queries)
+        with self.lock:
+            if not self.count:
+                return [[] for _ in queries]
+
+            best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+            best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+            for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, self.count)
+                block = self.vectors[start:end].astype(np.float32)
+                if self.dtype == np.int8:
+                    block /= INT8_SCALE
+                scores = query_vectors @ block.T
+                scores[:, ~self.live[start:end]] = -np.inf
+
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), scores.shape)], axis=1)
+                if best_scores.shape[1] > k:
+                    keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+            order = np.argsort(-best_scores, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+            # Rows are renumbered by compaction, so resolve them under the same lock
+            wanted = {int(row) for row, score in zip(best_rows.flat, best_scores.flat) if np.isfinite(score)}
+            with Session(self.engine) as session:
+                chunks = session.query(RagChunk).filter(
+                    RagChunk.collection == self.collection, RagChunk.row.in_(wanted)
+                ).all()
+                by_row = {chunk.row: (chunk.doc_id, chunk.text) for chunk in chunks}
+
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            results.append([
+                {"doc_id": by_row[int(row)][0], "text": by_row[int(row)][1], "score": float(score)}
+                for row, score in zip(rows, scores)
+                if np.isfinite(score) and int(row) in by_row
+            ])
+        return results
@@ -0,0 +1,156 @@
+import re
+import time
+import hashlib
+import threading
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlmodel import Field, Session, SQLModel, Index
+
+from src.config import Config
+from src.database import get_engine
+from .knowledge_base import KnowledgeBase
+
+"""
+Cache of web research shared by every project.
+
+Two tables: the link a normalized query resolved to, and what was fetched
+from a normalized URL (content hash, fetch time, formatted summary). Each
+side has its own TTL from `[RESEARCH_CACHE]`. A page whose TTL ran out is
+still kept, so if a re-fetch returns the same content its summary is reused
+without formatting it again. Both tables are trimmed to `MAX_ENTRIES`, least
+recently used first, and knowledge stored under an evicted query goes with it.
+"""
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class ResearchQuery(SQLModel, table=True):
+    __tablename__ = "research_query"
+    __table_args__ = (Index("ix_research_query_accessed_at", "accessed_at"),)
+
+    query: str = Field(primary_key=True)
+    url: str
+    searched_at: float
+    accessed_at: float
+
+
+class ResearchPage(SQLModel, table=True):
+    __tablename__ = "research_page"
+    __table_args__ = (Index("ix_research_page_accessed_at", "accessed_at"),)
+
+    url: str = Field(primary_key=True)
+    content_hash: str
+    summary: str
+    fetched_at: float
+    accessed_at: float
+
+
+class ResearchCache:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def __init__(self):
+        config = Config()
+        self.engine = get_engine()
+        self.enabled = config.get_research_cache_enabled()
+        self.query_ttl = config.get_research_cache_query_ttl()
+        self.page_ttl = config.get_research_cache_page_ttl()
+        self.max_entries = config.get_research_cache_max_entries()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return WHITESPACE_PATTERN.sub(" ", query).strip().lower()
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        parts = urlsplit(url.strip())
+        path = parts.path.rstrip("/") or "/"
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get_url(self, query: str) -> Optional[str]:
+        """
+        Link `query` resolved to, if it was searched within the query TTL.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self.lock, Session(self.engine) as session:
+            entry = session.get(ResearchQuery, self.normalize_query(query))
+            if entry is None or now - entry.searched_at > self.query_ttl:
+                return None
+            entry.accessed_at = now
+            session.add(entry)
+            session.commit()
+            return entry.url
+
+    def set_url(self, query: str, url: str):
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self.lock, Session(self.engine) as session:
+            session.merge(ResearchQuery(query=self.normalize_query(query), url=url, searched_at=now, accessed_at=now))
+            session.commit()
+            evicted = self.evict(session, ResearchQuery)
+
+        if evicted:
+            KnowledgeBase().delete_knowledge_many([entry.query for entry in evicted])
+
+    def get_summary(self, url: str, content: str = None) -> Optional[str]:
+        """
+        Formatted summary of `url` if it was fetched within the page TTL or,
+        given the freshly fetched `content`, if that content hasn't changed.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self.lock, Session(self.engine) as session:
+            entry = session.get(ResearchPage, self.normalize_url(url))
+            if entry is None:
+                return None
+            if content is not None:
+                if entry.content_hash != self.content_hash(content):
+                    return None
+                entry.fetched_at = now
+            elif now - entry.fetched_at > self.page_ttl:
+                return None
+            entry.accessed_at = now
+            session.add(entry)
+            session.commit()
+            return entry.summary
+
+    def set_summary(self, url: str, content: str, summary: str):
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self.lock, Session(self.engine) as session:
+            session.merge(ResearchPage(
+                url=self.normalize_url(url),
+                content_hash=self.content_hash(content),
+                summary=summary,
+                fetched_at=now,
+                accessed_at=now
+            ))
+            session.commit()
+            self.evict(session, ResearchPage)
+
+    def evict(self, session: Session, model) -> list:
+        stale = session.query(model).order_by(model.accessed_at.desc()).offset(self.max_entries).all()
+        for entry in stale:
+            session.delete(entry)
+        if stale:
+            session.commit()
+        return stale
@@ -1,26 +1,85 @@
 import os
 import json
-import zipfile
+import time
+import threading
 from datetime import datetime
 from typing import Optional
 from src.socket_instance import emit_agent
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel import Field, Session, SQLModel, Index
 from src.config import Config
+from src.database import get_engine
+from src.filesystem import FileIndex
+from src.filesystem.zip_stream import ZipStream
 
 
 class Projects(SQLModel, table=True):
+    """
+    `message_stack_json` is only read to migrate old projects into `message`.
+    """
     id: Optional[int] = Field(default=None, primary_key=True)
-    project: str
+    project: str = Field(index=True)
     message_stack_json: str
 
 
+class Message(SQLModel, table=True):
+    __tablename__ = "message"
+    __table_args__ = (
+        Index("ix_message_project_id", "project", "id"),
+        Index("ix_message_project_from_devika_id", "project", "from_devika", "id"),
+        # Never reuse ids of deleted messages, clients page with `after=<id>`
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: str
+    from_devika: bool
+    message: Optional[str] = None
+    timestamp: str
+
+
 class ProjectManager:
+    migrated = False
+
+    # One condition per project, notified whenever the user sends a message
+    # so an agent waiting on `ask_user` wakes up straight away
+    reply_conditions = {}
+    reply_lock = threading.Lock()
+
     def __init__(self):
         config = Config()
-        sqlite_path = config.get_sqlite_db()
         self.project_path = config.get_projects_dir()
-        self.engine = create_engine(f"sqlite:///{sqlite_path}")
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_engine()
+        if not ProjectManager.migrated:
+            self.migrate_message_stacks()
+            ProjectManager.migrated = True
+
+    def migrate_message_stacks(self):
+        with Session(self.engine) as session:
+            legacy_projects = session.query(Projects).filter(Projects.message_stack_json != "[]").all()
+            for project_state in legacy_projects:
+                for message in json.loads(project_state.message_stack_json):
+                    session.add(self.message_row(project_state.project, message))
+                project_state.message_stack_json = json.dumps([])
+                session.add(project_state)
+            session.commit()
+
+    @staticmethod
+    def message_row(project: str, message: dict) -> Message:
+        return Message(
+            project=project,
+            from_devika=message["from_devika"],
+            message=message["message"],
+            timestamp=message["timestamp"]
+        )
+
+    @staticmethod
+    def message_dict(row: Message) -> dict:
+        return {
+            "id": row.id,
+            "from_devika": row.from_devika,
+            "message": row.message,
+            "timestamp": row.timestamp
+        }
 
     def new_message(self):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -39,73 +98,97 @@ class ProjectManager:
 
     def delete_project(self, project: str):
         with Session(self.engine) as session:
+            session.query(Message).filter(Message.project == project).delete()
             project_state = session.query(Projects).filter(Projects.project == project).first()
             if project_state:
                 session.delete(project_state)
-                session.commit()
+            session.commit()
 
-    def add_message_to_project(self, project: str, message: dict):
+    def add_message_to_project(self, project: str, message: dict) -> dict:
         with Session(self.engine) as session:
             project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                message_stack.append(message)
-                project_state.message_stack_json = json.dumps(message_stack)
-                session.commit()
-            else:
-                message_stack = [message]
-                project_state = Projects(project=project, message_stack_json=json.dumps(message_stack))
-                session.add(project_state)
-                session.commit()
+            if not project_state:
+                session.add(Projects(project=project, message_stack_json=json.dumps([])))
+            row = self.message_row(project, message)
+            session.add(row)
+            session.commit()
+            return self.message_dict(row)
 
     def add_message_from_devika(self, project: str, message: str):
         new_message = self.new_message()
         new_message["message"] = message
-        emit_agent("server-message", {"messages": new_message})
-        self.add_message_to_project(project, new_message)
+        new_message = self.add_message_to_project(project, new_message)
+        emit_agent("server-message", {"project_name": project, "messages": new_message})
+        return new_message
 
     def add_message_from_user(self, project: str, message: str):
         new_message = self.new_message()
         new_message["message"] = message
         new_message["from_devika"] = False
-        emit_agent("server-message", {"messages": new_message})
-        self.add_message_to_project(project, new_message)
+        new_message = self.add_message_to_project(project, new_message)
+        emit_agent("server-message", {"project_name": project, "messages": new_message})
+
+        condition = self.reply_condition(project)
+        with condition:
+            condition.notify_all()
+
+    def reply_condition(self, project: str) -> threading.Condition:
+        with ProjectManager.reply_lock:
+            if project not in ProjectManager.reply_conditions:
+                ProjectManager.reply_conditions[project] = threading.Condition()
+            return ProjectManager.reply_conditions[project]
 
-    def get_messages(self, project: str):
+    def wait_for_user_message(self, project: str, after: int, timeout: float):
+        """
+        Block until the user has the last word with a message newer than `after`,
+        returns it, or None once `timeout` seconds pass without one.
+        """
+        deadline = time.monotonic() + timeout
+        condition = self.reply_condition(project)
+        with condition:
+            while True:
+                message = self.latest_message(project)
+                if message and not message["from_devika"] and message["id"] > after:
+                    return message
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                condition.wait(remaining)
+
+    def get_messages(self, project: str, after: int = None, limit: int = None):
+        """
+        Messages in order, only those with `id > after` when paging, at most `limit` of them.
+        """
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                return json.loads(project_state.message_stack_json)
-            return None
+            if not session.query(Projects).filter(Projects.project == project).first():
+                return None
 
-    def get_latest_message_from_user(self, project: str):
+            query = session.query(Message).filter(Message.project == project)
+            if after:
+                query = query.filter(Message.id > after)
+            query = query.order_by(Message.id)
+            if limit:
+                query = query.limit(limit)
+            return [self.message_dict(row) for row in query.all()]
+
+    def latest_message(self, project: str, from_devika: bool = None):
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                for message in reversed(message_stack):
-                    if not message["from_devika"]:
-                        return message
-            return None
+            query = session.query(Message).filter(Message.project == project)
+            if from_devika is not None:
+                query = query.filter(Message.from_devika == from_devika)
+            row = query.order_by(Message.id.desc()).first()
+            return self.message_dict(row) if row else None
+
+    def get_latest_message_from_user(self, project: str):
+        return self.latest_message(project, from_devika=False)
 
     def validate_last_message_is_from_user(self, project: str):
-        with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                if message_stack:
-                    return not message_stack[-1]["from_devika"]
-            return False
+        message = self.latest_message(project)
+        return bool(message) and not message["from_devika"]
 
     def get_latest_message_from_devika(self, project: str):
-        with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                for message in reversed(message_stack):
-                    if message["from_devika"]:
-                        return message
-            return None
+        return self.latest_message(project, from_devika=True)
 
     def get_project_list(self):
         with Session(self.engine) as session:
@@ -115,61 +198,65 @@ class ProjectManager:
     def get_all_messages_formatted(self, project: str):
         formatted_messages = []
 
-        with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                for message in message_stack:
-                    if message["from_devika"]:
-                        formatted_messages.append(f"Devika: {message['message']}")
-                    else:
-                        formatted_messages.append(f"User: {message['message']}")
+        for message in self.get_messages(project) or []:
+            if message["from_devika"]:
+                formatted_messages.append(f"Devika: {message['message']}")
+            else:
+                formatted_messages.append(f"User: {message['message']}")
 
-            return formatted_messages
+        return formatted_messages
 
     def get_project_path(self, project: str):
         return os.path.join(self.project_path, project.lower().replace(" ", "-"))
 
-    def project_to_zip(self, project: str):
+    def project_zip_stream(self, project: str):
+        """
+        Generator of ZIP bytes for the project, with the project folder as the archive root.
+        """
         project_path = self.get_project_path(project)
-        zip_path = f"{project_path}.zip"
-
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(project_path):
-                for file in files:
-                    relative_path = os.path.relpath(os.path.join(root, file), os.path.join(project_path, '..'))
-                    zipf.write(os.path.join(root, file), arcname=relative_path)
-
-        return zip_path
-
-    def get_zip_path(self, project: str):
-        return f"{self.get_project_path(project)}.zip"
-    
-    def get_project_files(self, project_name: str):
-        if not project_name:
-            return []
+        return ZipStream().stream(project_path, os.path.basename(project_path))
 
+    def get_project_directory(self, project_name: str):
         project_directory = "-".join(project_name.split(" "))
         base_path = os.path.abspath(os.path.join(os.getcwd(), 'data', 'projects'))
         directory = os.path.join(base_path, project_directory)
 
         # Ensure the directory is within the allowed base path
         if not os.path.exists(directory) or not os.path.commonprefix([directory, base_path]) == base_path:
+            return None
+        return directory
+
+    def get_project_tree(self, project_name: str):
+        """
+        Indexed metadata of every project file, without contents.
+        """
+        directory = self.get_project_directory(project_name) if project_name else None
+        if not directory:
+            return []
+
+        return [
+            {key: entry[key] for key in ("path", "size", "mtime", "hash", "binary", "too_large")}
+            for entry in FileIndex().refresh(directory)
+        ]
+
+    def get_project_file(self, project_name: str, path: str):
+        directory = self.get_project_directory(project_name) if project_name else None
+        if not directory:
+            return None
+        return FileIndex().read(directory, path)
+
+    def get_project_files(self, project_name: str):
+        directory = self.get_project_directory(project_name) if project_name else None
+        if not directory:
             return []
 
+        file_index = FileIndex()
         files = []
-        for root, _, filenames in os.walk(directory):
-            for filename in filenames:
-                file_relative_path = os.path.relpath(root, directory)
-                if file_relative_path == '.':
-                    file_relative_path = ''
-                file_path = os.path.join(file_relative_path, filename)
-                try:
-                    with open(os.path.join(root, filename), 'r') as file:
-                        files.append({
-                            "file": file_path,
-                            "code": file.read()
-                        })
-                except Exception as e:
-                    print(f"Error reading file {filename}: {e}")
+        for entry in file_index.text_files(directory):
+            code = file_index.read(directory, entry["path"])
+            if code is not None:
+                files.append({
+                    "file": entry["path"],
+                    "code": code
+                })
         return files
@@ -5,15 +5,20 @@ from functools import wraps
 import json
 
 from src.socket_instance import emit_agent
+from src.llm.cache import PendingResponses
 
 def retry_wrapper(func):
     def wrapper(*args, **kwargs):
         max_tries = 5
         tries = 0
         while tries < max_tries:
-            result = func(*args, **kwargs)
-            if result:
-                return result
+            # Responses only reach the LLM cache once the agent accepts them
+            with PendingResponses() as responses:
+                result = func(*args, **kwargs)
+                if result:
+                    responses.accept()
+                    return result
+                responses.reject()
             print("Invalid response from the model, I'm trying again...")
             emit_agent("info", {"type": "warning", "message": "Invalid response from the model, trying again..."})
             tries += 1
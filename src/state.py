@@ -1,26 +1,190 @@
 import json
-import os
+import time
+import atexit
+import threading
 from datetime import datetime
 from typing import Optional
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Field, Session, SQLModel, Index
 from src.socket_instance import emit_agent
 from src.config import Config
+from src.database import get_engine
+from src.token_usage import TokenUsage
+from src.logger import Logger
+
+logger = Logger()
 
 
 class AgentStateModel(SQLModel, table=True):
+    """
+    Legacy storage, the whole state stack as one JSON blob per project.
+    Only read to migrate old projects into `agent_state_step`.
+    """
     __tablename__ = "agent_state"
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    project: str
+    project: str = Field(index=True)
     state_stack_json: str
 
 
+class AgentStateHeader(SQLModel, table=True):
+    __tablename__ = "agent_state_header"
+
+    project: str = Field(primary_key=True)
+    last_seq: int = 0
+    agent_is_active: bool = True
+    completed: bool = False
+
+
+class AgentStateStep(SQLModel, table=True):
+    __tablename__ = "agent_state_step"
+    __table_args__ = (Index("ix_agent_state_step_project_seq", "project", "seq", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: str
+    seq: int
+    state_json: str
+
+
+class StateCache:
+    """
+    Process-wide write-behind cache in front of the agent state tables.
+
+    Each project keeps its header and newest step in memory, so the agent
+    loop and the polling endpoints never go to SQLite for the current state.
+    Changed headers and steps are written back in one transaction every
+    `FLUSH_INTERVAL` seconds, and right away when an agent completes,
+    crashes or the process exits.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.entries = {}
+            cls._instance.dirty = set()
+            cls._instance.lock = threading.RLock()
+            cls._instance.thread = None
+            cls._instance.engine = get_engine()
+            atexit.register(cls._instance.flush)
+        return cls._instance
+
+    def entry(self, project: str) -> dict:
+        """
+        The cached `{"header", "latest"}` for a project, loaded from SQLite on first use.
+        Call with `lock` held.
+        """
+        if project not in self.entries:
+            entry = {"header": None, "latest": None}
+            with Session(self.engine) as session:
+                header = session.get(AgentStateHeader, project)
+                if header is not None:
+                    entry["header"] = AgentStateHeader(
+                        project=project,
+                        last_seq=header.last_seq,
+                        agent_is_active=header.agent_is_active,
+                        completed=header.completed
+                    )
+                    step = session.query(AgentStateStep).filter(
+                        AgentStateStep.project == project, AgentStateStep.seq == header.last_seq
+                    ).first()
+                    if step:
+                        entry["latest"] = json.loads(step.state_json)
+            self.entries[project] = entry
+        return self.entries[project]
+
+    def mark_dirty(self, project: str):
+        self.dirty.add(project)
+
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(Config().get_state_flush_interval())
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Agent state flush failed, retrying: {e}")
+
+    def flush(self, project: str = None):
+        with self.lock:
+            projects = [project] if project else list(self.dirty)
+            projects = [name for name in projects if name in self.dirty]
+            if not projects:
+                return
+
+            with Session(self.engine) as session:
+                for name in projects:
+                    entry = self.entries[name]
+                    header = entry["header"]
+                    session.execute(insert(AgentStateHeader).values(
+                        project=name,
+                        last_seq=header.last_seq,
+                        agent_is_active=header.agent_is_active,
+                        completed=header.completed
+                    ).on_conflict_do_update(
+                        index_elements=["project"],
+                        set_={
+                            "last_seq": header.last_seq,
+                            "agent_is_active": header.agent_is_active,
+                            "completed": header.completed
+                        }
+                    ))
+                    for seq, state_json in sorted(entry.get("pending", {}).items()):
+                        session.execute(insert(AgentStateStep).values(
+                            project=name, seq=seq, state_json=state_json
+                        ).on_conflict_do_update(
+                            index_elements=["project", "seq"],
+                            set_={"state_json": state_json}
+                        ))
+                session.commit()
+
+            for name in projects:
+                self.dirty.discard(name)
+                self.entries[name].pop("pending", None)
+
+    def drop(self, project: str):
+        with self.lock:
+            self.entries.pop(project, None)
+            self.dirty.discard(project)
+
+
 class AgentState:
+    migrated = False
+
     def __init__(self):
-        config = Config()
-        sqlite_path = config.get_sqlite_db()
-        self.engine = create_engine(f"sqlite:///{sqlite_path}")
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_engine()
+        self.token_usage = TokenUsage()
+        if not AgentState.migrated:
+            self.migrate_legacy_state()
+            AgentState.migrated = True
+        self.cache = StateCache()
+
+    def migrate_legacy_state(self):
+        legacy_tokens = {}
+        with Session(self.engine) as session:
+            legacy_rows = session.query(AgentStateModel).order_by(AgentStateModel.id).all()
+            for row in legacy_rows:
+                if session.get(AgentStateHeader, row.project) is None:
+                    state_stack = json.loads(row.state_stack_json)
+                    for seq, state in enumerate(state_stack, start=1):
+                        session.add(AgentStateStep(project=row.project, seq=seq, state_json=json.dumps(state)))
+                    header = AgentStateHeader(project=row.project, last_seq=len(state_stack))
+                    if state_stack:
+                        self.apply_flags(header, state_stack[-1])
+                        # The legacy stack kept the project's running token total on its newest state
+                        legacy_tokens[row.project] = state_stack[-1].get("token_usage", 0)
+                    session.add(header)
+                    session.flush()
+                session.delete(row)
+            session.commit()
+
+        # Counted once the migration is committed, `TokenUsage` writes through its own session
+        for project, tokens in legacy_tokens.items():
+            if tokens:
+                self.token_usage.add(project, tokens, kind="unknown")
 
     def new_state(self):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -44,134 +208,161 @@ class AgentState:
             "timestamp": timestamp
         }
 
-    def create_state(self, project: str):
+    @staticmethod
+    def apply_flags(header: AgentStateHeader, state: dict):
+        # The newest step decides whether the agent is active/completed, as it did in the JSON stack
+        header.agent_is_active = state.get("agent_is_active", header.agent_is_active)
+        header.completed = state.get("completed", header.completed)
+
+    @staticmethod
+    def with_flags(header: AgentStateHeader, state: dict) -> dict:
+        state["agent_is_active"] = header.agent_is_active
+        state["completed"] = header.completed
+        return state
+
+    def load_stack(self, session: Session, project: str) -> list:
+        header = session.get(AgentStateHeader, project)
+        if header is None:
+            return None
+        steps = session.query(AgentStateStep).filter(AgentStateStep.project == project).order_by(AgentStateStep.seq).all()
+        state_stack = [json.loads(step.state_json) for step in steps]
+        if state_stack:
+            self.with_flags(header, state_stack[-1])
+        return state_stack
+
+    def write_step(self, project: str, entry: dict, state: dict, op: str):
+        """
+        Store `state` as the newest step in the cache, queue it for the next
+        flush and send it to the UI. Call with the cache lock held.
+        """
+        header = entry["header"]
+        self.apply_flags(header, state)
+        state_json = json.dumps(state)
+        entry["latest"] = json.loads(state_json)
+        entry.setdefault("pending", {})[header.last_seq] = state_json
+        self.cache.mark_dirty(project)
+        self.emit_step(project, entry, op)
+
+    def append_step(self, project: str, state: dict, op: str = "append"):
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["header"] is None:
+                entry["header"] = AgentStateHeader(project=project, last_seq=0)
+            entry["header"].last_seq += 1
+            self.write_step(project, entry, state, op)
+
+    def emit_step(self, project: str, entry: dict, op: str):
+        """
+        Send only the step that changed, clients resync through `get_steps_after`
+        if they notice a gap in `seq`.
+        """
+        emit_agent("agent-state-step", {
+            "project_name": project,
+            "op": op,
+            "seq": entry["header"].last_seq,
+            "state": self.with_flags(entry["header"], dict(entry["latest"]))
+        })
+
+    def flush(self, project: str = None):
+        self.cache.flush(project)
+
+    def get_steps_after(self, project: str, after: int = 0, limit: int = None) -> dict:
+        self.flush(project)
         with Session(self.engine) as session:
-            new_state = self.new_state()
-            new_state["step"] = 1
-            new_state["internal_monologue"] = "I'm starting the work..."
-            agent_state = AgentStateModel(project=project, state_stack_json=json.dumps([new_state]))
-            session.add(agent_state)
-            session.commit()
-            emit_agent("agent-state", [new_state])
+            header = session.get(AgentStateHeader, project)
+            if header is None:
+                return {"steps": [], "last_seq": 0}
+
+            query = session.query(AgentStateStep).filter(
+                AgentStateStep.project == project, AgentStateStep.seq > after
+            ).order_by(AgentStateStep.seq)
+            if limit:
+                query = query.limit(limit)
+
+            steps = [{"seq": step.seq, "state": json.loads(step.state_json)} for step in query.all()]
+            if steps and steps[-1]["seq"] == header.last_seq:
+                self.with_flags(header, steps[-1]["state"])
+            return {"steps": steps, "last_seq": header.last_seq}
+
+    def create_state(self, project: str):
+        new_state = self.new_state()
+        new_state["step"] = 1
+        new_state["internal_monologue"] = "I'm starting the work..."
+        self.append_step(project, new_state)
 
     def delete_state(self, project: str):
+        self.cache.drop(project)
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).all()
-            if agent_state:
-                for state in agent_state:
-                    session.delete(state)
-                session.commit()
+            session.query(AgentStateStep).filter(AgentStateStep.project == project).delete()
+            session.query(AgentStateHeader).filter(AgentStateHeader.project == project).delete()
+            session.commit()
 
     def add_to_current_state(self, project: str, state: dict):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack.append(state)
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [state]
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+        self.append_step(project, state)
 
     def get_current_state(self, project: str):
+        self.flush(project)
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)
-            return None
+            return self.load_stack(session, project)
 
     def update_latest_state(self, project: str, state: dict):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1] = state
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["latest"] is None:
+                self.append_step(project, state, "update")
             else:
-                state_stack = [state]
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+                self.write_step(project, entry, state, "update")
 
     def get_latest_state(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]
-            return None
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["latest"] is None:
+                return None
+            return self.with_flags(entry["header"], json.loads(json.dumps(entry["latest"])))
 
     def set_agent_active(self, project: str, is_active: bool):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1]["agent_is_active"] = is_active
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["latest"] is None:
+                new_state = self.new_state()
+                new_state["agent_is_active"] = is_active
+                self.append_step(project, new_state, "update")
             else:
-                state_stack = [self.new_state()]
-                state_stack[-1]["agent_is_active"] = is_active
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+                entry["header"].agent_is_active = is_active
+                self.cache.mark_dirty(project)
+                self.emit_step(project, entry, "update")
 
     def is_agent_active(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["agent_is_active"]
-            return None
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["latest"] is None:
+                return None
+            return entry["header"].agent_is_active
 
     def set_agent_completed(self, project: str, is_completed: bool):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1]["internal_monologue"] = "Agent has completed the task."
-                state_stack[-1]["completed"] = is_completed
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["latest"] is None:
+                new_state = self.new_state()
+                new_state["completed"] = is_completed
+                self.append_step(project, new_state, "update")
             else:
-                state_stack = [self.new_state()]
-                state_stack[-1]["completed"] = is_completed
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+                state = self.with_flags(entry["header"], dict(entry["latest"]))
+                state["internal_monologue"] = "Agent has completed the task."
+                state["completed"] = is_completed
+                self.write_step(project, entry, state, "update")
+        # A finished run shouldn't wait for the next periodic flush
+        self.flush(project)
 
     def is_agent_completed(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["completed"]
-            return None
-            
+        with self.cache.lock:
+            entry = self.cache.entry(project)
+            if entry["latest"] is None:
+                return None
+            return entry["header"].completed
+
     def update_token_usage(self, project: str, token_usage: int):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1]["token_usage"] += token_usage
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [self.new_state()]
-                state_stack[-1]["token_usage"] = token_usage
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
+        self.token_usage.add(project, token_usage)
 
     def get_latest_token_usage(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["token_usage"]
-            return 0
-        
\ No newline at end of file
+        return self.token_usage.get_total(project)
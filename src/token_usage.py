@@ -0,0 +1,78 @@
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Field, Session, SQLModel, Index
+
+from src.database import get_engine
+
+"""
+Token counters, one row per (project, agent, model, kind) where kind is
+"prompt" or "completion". Every inference bumps its row with a single
+upsert (`tokens = tokens + ?`), so concurrent agents never overwrite each
+other and nothing has to load the agent state to count tokens.
+"""
+
+
+class TokenUsageCounter(SQLModel, table=True):
+    __tablename__ = "token_usage"
+    __table_args__ = (Index("ix_token_usage_key", "project", "agent", "model", "kind", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: str
+    agent: str = ""
+    model: str = ""
+    kind: str
+    tokens: int = 0
+
+
+class TokenUsage:
+    def __init__(self):
+        self.engine = get_engine()
+
+    def add(self, project: str, tokens: int, agent: str = None, model: str = None, kind: str = "prompt") -> int:
+        """
+        Count `tokens` against the project and return its new total.
+        """
+        with Session(self.engine) as session:
+            statement = insert(TokenUsageCounter).values(
+                project=project, agent=agent or "", model=model or "", kind=kind, tokens=tokens
+            ).on_conflict_do_update(
+                index_elements=["project", "agent", "model", "kind"],
+                set_={"tokens": TokenUsageCounter.tokens + tokens}
+            )
+            session.execute(statement)
+            total = self.project_total(session, project)
+            session.commit()
+            return total
+
+    @staticmethod
+    def project_total(session: Session, project: str) -> int:
+        return session.query(func.coalesce(func.sum(TokenUsageCounter.tokens), 0)).filter(
+            TokenUsageCounter.project == project
+        ).scalar()
+
+    def get_total(self, project: str) -> int:
+        with Session(self.engine) as session:
+            return self.project_total(session, project)
+
+    def get_usage(self, project: str) -> dict:
+        """
+        Project total plus prompt/completion splits per agent and per model.
+        """
+        usage = {"token_usage": 0, "prompt": 0, "completion": 0, "agents": {}, "models": {}}
+        with Session(self.engine) as session:
+            rows = session.query(TokenUsageCounter).filter(TokenUsageCounter.project == project).all()
+
+        for row in rows:
+            usage["token_usage"] += row.tokens
+            usage[row.kind] = usage.get(row.kind, 0) + row.tokens
+            for breakdown, name in (("agents", row.agent), ("models", row.model)):
+                counts = usage[breakdown].setdefault(name or "unknown", {"prompt": 0, "completion": 0})
+                counts[row.kind] = counts.get(row.kind, 0) + row.tokens
+
+        return usage
+
+    def delete_usage(self, project: str):
+        with Session(self.engine) as session:
+            session.query(TokenUsageCounter).filter(TokenUsageCounter.project == project).delete()
+            session.commit()
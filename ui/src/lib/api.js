@@ -8,6 +8,7 @@ import {
   searchEngineList,
 } from "./store";
 import { io } from "socket.io-client";
+import { get } from "svelte/store";
 
 
 const getApiBaseUrl = () => {
@@ -64,17 +65,27 @@ export async function deleteProject(projectName) {
   });
 }
 
-export async function fetchMessages() {
-  const projectName = localStorage.getItem("selectedProject");
-  const response = await fetch(`${API_BASE_URL}/api/messages`, {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-    },
-    body: JSON.stringify({ project_name: projectName }),
+// Append messages newer than the last one we have, socket pushes and
+// paged fetches can overlap
+export function appendMessages(newMessages) {
+  messages.update((msgs) => {
+    const current = msgs || [];
+    const lastId = current.length ? current[current.length - 1].id : 0;
+    return [...current, ...newMessages.filter((msg) => !msg.id || msg.id > lastId)];
   });
+}
+
+export async function fetchMessages(after = 0) {
+  const projectName = localStorage.getItem("selectedProject");
+  const response = await fetch(
+    `${API_BASE_URL}/api/messages?project_name=${encodeURIComponent(projectName)}&after=${after}`
+  );
   const data = await response.json();
-  messages.set(data.messages);
+  if (after) {
+    appendMessages(data.messages || []);
+  } else {
+    messages.set(data.messages);
+  }
 }
 
 export async function fetchAgentState() {
@@ -90,6 +101,13 @@ export async function fetchAgentState() {
   agentState.set(data.state);
 }
 
+export async function fetchAgentStateSteps(projectName, after) {
+  const response = await fetch(
+    `${API_BASE_URL}/api/agent-state-steps?project_name=${encodeURIComponent(projectName)}&after=${after}`
+  );
+  return await response.json();
+}
+
 export async function executeAgent(prompt) {
   const projectName = localStorage.getItem("selectedProject");
   const modelId = localStorage.getItem("selectedModel");
@@ -111,7 +129,8 @@ export async function executeAgent(prompt) {
     }),
   });
 
-  await fetchMessages();
+  const current = get(messages) || [];
+  await fetchMessages(current.length ? current[current.length - 1].id : 0);
 }
 
 export async function getBrowserSnapshot(snapshotPath) {
@@ -126,14 +145,28 @@ export async function getBrowserSnapshot(snapshotPath) {
   return data.snapshot;
 }
 
-export async function fetchProjectFiles() {
+export async function fetchProjectTree() {
   const projectName = localStorage.getItem("selectedProject");
-  const response = await fetch(`${API_BASE_URL}/api/get-project-files?project_name=${projectName}`)
+  const response = await fetch(
+    `${API_BASE_URL}/api/get-project-tree?project_name=${encodeURIComponent(projectName)}`
+  )
   const data = await response.json();
   projectFiles.set(data.files);
   return data.files;
 }
 
+export async function fetchProjectFile(path) {
+  const projectName = localStorage.getItem("selectedProject");
+  const response = await fetch(
+    `${API_BASE_URL}/api/get-project-file?project_name=${encodeURIComponent(projectName)}&path=${encodeURIComponent(path)}`
+  )
+  if (!response.ok) {
+    return null;
+  }
+  const data = await response.json();
+  return data.code;
+}
+
 export async function checkInternetStatus() {
   if (navigator.onLine) {
     internet.set(true);
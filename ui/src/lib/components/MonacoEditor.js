@@ -90,7 +90,8 @@ function switchTab(editor, models, filename, tabElement) {
   tabElement.classList.add("bg-secondary");
 }
 
-export function sidebar(editor, models, sidebarContainer) {
+// `paths` may list files that have no model yet, clicking one asks `openFile` to load it
+export function sidebar(editor, models, sidebarContainer, paths = Object.keys(models), openFile = null) {
   sidebarContainer.innerHTML = "";
   const createSidebarElement = (filename, isFolder) => {
     const sidebarElement = document.createElement("div");
@@ -104,37 +105,43 @@ export function sidebar(editor, models, sidebarContainer) {
     return sidebarElement;
   };
 
-  const changeTabColor = (index) => {
+  const changeTabColor = (filename) => {
     const allTabElements = document.querySelectorAll("#tabContainer")[0].children;
     for (let i = 0; i < allTabElements?.length; i++) {
-      allTabElements[i].classList.remove("bg-secondary");
+      allTabElements[i].classList.toggle(
+        "bg-secondary",
+        allTabElements[i].getAttribute("data-filename") === filename
+      );
     }
-    allTabElements[index].classList.add("bg-secondary");
   }
 
   const folders = {};
+  const filenames = [...new Set([...paths, ...Object.keys(models)])];
 
-  Object.entries(models).forEach(([filename, model], modelIndex) => {
+  filenames.forEach((filename) => {
     const parts = filename.split('/');
     let currentFolder = sidebarContainer;
 
     parts.forEach((part, index) => {
       if (index === parts.length - 1) {
         const fileElement = createSidebarElement(part, false);
-        fileElement.addEventListener("click", () => {
-          editor.setModel(model);
-          changeTabColor(modelIndex);
+        fileElement.addEventListener("click", async () => {
+          const model = models[filename] || (openFile && await openFile(filename));
+          if (model) {
+            editor.setModel(model);
+            changeTabColor(filename);
+          }
         });
         currentFolder.appendChild(fileElement);
       } else {
-        const folderName = part;
-        if (!folders[folderName]) {
+        const folderPath = parts.slice(0, index + 1).join('/');
+        if (!folders[folderPath]) {
           const folderElement = createSidebarElement(part, true);
           currentFolder.appendChild(folderElement);
-          folders[folderName] = folderElement;
+          folders[folderPath] = folderElement;
           currentFolder = folderElement;
         } else {
-          currentFolder = folders[folderName];
+          currentFolder = folders[folderPath];
         }
       }
     });
@@ -1,9 +1,18 @@
-import { socket } from "./api";
-import { messages, agentState, isSending, tokenUsage } from "./store";
+import { socket, fetchAgentStateSteps, appendMessages } from "./api";
+import { agentState, isSending, tokenUsage, selectedProject, streamingOutput } from "./store";
 import { toast } from "svelte-sonner";
 import { get } from "svelte/store";
 
 let prevMonologue = null;
+let lastSeq = null;
+let unsubscribeProject = null;
+
+function applyAgentState(state) {
+  agentState.set(state);
+  if (state.completed) {
+    isSending.set(false);
+  }
+}
 
 export function initializeSockets() {
 
@@ -19,21 +28,57 @@ export function initializeSockets() {
 
   socket.on("server-message", function (data) {
     console.log(data)
-    messages.update((msgs) => [...msgs, data["messages"]]);
+    if (data["project_name"] && data["project_name"] !== get(selectedProject)) {
+      return;
+    }
+    appendMessages([data["messages"]]);
+    streamingOutput.update((output) => (output && output.done ? null : output));
   });
 
-  socket.on("agent-state", function (state) {
-    const lastState = state[state.length - 1];
-    agentState.set(lastState);
-    if (lastState.completed) {
-      isSending.set(false);
+  socket.on("agent-state-step", async function (delta) {
+    if (delta.project_name !== get(selectedProject)) {
+      return;
+    }
+    // Steps only arrive as deltas, catch up if one was missed
+    if (delta.op === "append" && lastSeq !== null && delta.seq > lastSeq + 1) {
+      const data = await fetchAgentStateSteps(delta.project_name, lastSeq);
+      if (delta.project_name !== get(selectedProject)) {
+        return;
+      }
+      if (data.steps.length) {
+        applyAgentState(data.steps[data.steps.length - 1].state);
+      }
+      lastSeq = data.last_seq;
+      return;
     }
+    lastSeq = delta.seq;
+    applyAgentState(delta.state);
   });
 
   socket.on("tokens", function (tokens) {
+    if (tokens["project_name"] && tokens["project_name"] !== get(selectedProject)) {
+      return;
+    }
     tokenUsage.set(tokens["token_usage"]);
   });
 
+  socket.on("inference-stream", function (data) {
+    if (data["project_name"] !== get(selectedProject)) {
+      return;
+    }
+    streamingOutput.update((output) => ({
+      agent: data["agent"],
+      text: data["start"] || !output ? data["token"] : output.text + data["token"],
+      done: data["done"],
+    }));
+  });
+
+  unsubscribeProject = selectedProject.subscribe(() => {
+    // Sequence numbers are per project
+    lastSeq = null;
+    streamingOutput.set(null);
+  });
+
   socket.on("inference", function (error) {
     if (error["type"] == "error") {
       toast.error(error["message"]);
@@ -76,11 +121,16 @@ export function destroySockets() {
   if (socket.connected) {
     socket.off("socket_response");
     socket.off("server-message");
-    socket.off("agent-state");
+    socket.off("agent-state-step");
     socket.off("tokens");
+    socket.off("inference-stream");
     socket.off("inference");
     socket.off("info");
   }
+  if (unsubscribeProject) {
+    unsubscribeProject();
+    unsubscribeProject = null;
+  }
 }
 
 export function emitMessage(channel, message) {
@@ -43,6 +43,7 @@ export const searchEngineList = writable([]);
 // Agent related stores
 export const agentState = writable(null);
 export const isSending = writable(false);
+export const streamingOutput = writable(null);
 
 // Token usage store
 export const tokenUsage = writable(0);